@@ -1,33 +1,57 @@
 import os
-import re
-from datetime import datetime, timedelta
-from collections import Counter
-import io
 
-# Import eventlet early if using eventlet async mode
-if os.environ.get('SOCKETIO_ASYNC_MODE', 'threading') == 'eventlet':
+# SocketIO async mode - gevent by default so websocket clients and I/O-bound
+# handlers (MongoDB, Gemini, IP lookups) share green threads instead of OS threads
+ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'gevent')
+
+# Patch the standard library for green-thread async modes before anything else imports
+# threading/socket/queue (concurrent.futures creates its module lock at import time)
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
     import eventlet
     eventlet.monkey_patch()
 
-from flask import Flask, request, send_file, jsonify, send_from_directory, Response
+import re
+import time
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+from collections import Counter, deque
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_right
+from itertools import chain
+import io
+import csv
+import tempfile
+import ipaddress
+
+from flask import Flask, Request, request, send_file, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from flask_pymongo import PyMongo
+from pymongo import UpdateOne
 from werkzeug.utils import secure_filename
 from bson import ObjectId
 from dotenv import load_dotenv
-import pandas as pd
 
 # Import custom modules
-from parser import parse_pcap, parse_access_log
+from parser import iter_pcap, iter_access_log
 from detectors import run_all
-from ip_services import get_ip_geolocation, get_ip_reputation, get_ip_history, check_ip_in_cidr
+from ip_services import (
+    get_ip_geolocation, get_ip_reputation, get_ip_history, get_ip_history_bulk, cidr_to_regex, bulk_geolocate_ips,
+    bulk_get_ip_reputation, build_cidr_index, ips_in_any_cidr, ensure_ip_indexes, is_valid_ip
+)
 from report_generator import generate_pdf_report
-from models_mongodb import AlertDocument, BlocklistDocument, WhitelistDocument
+from models_mongodb import AlertDocument, BlocklistDocument, WhitelistDocument, utcnow
 
 # Import PCAP routes
 from routes.pcap_routes import pcap_bp
 from services.pcap_service import PcapCaptureService
+from services.ip_list_service import IpListService
+from services.stats_rollup_service import StatsRollupService, REFRESH_MIN_INTERVAL
 
 # Import Gemini routes
 from routes.gemini_routes import gemini_bp
@@ -36,6 +60,12 @@ from services.gemini_service import GeminiThreatIntelligence
 # Load environment variables
 load_dotenv()
 
+# Extracts the Atlas cluster name from SRV DNS resolution errors
+_DNS_CLUSTER_RE = re.compile(r'_mongodb\._tcp\.([^.]+)')
+
+# 24-hex-digit ObjectId strings (checked before ObjectId() so bad IDs never raise)
+_OID_RE = re.compile(r'[0-9a-fA-F]{24}')
+
 # Validate critical environment variables
 MONGO_URI = os.environ.get("MONGO_URI")
 SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key-change-in-production")
@@ -48,18 +78,40 @@ if not (MONGO_URI.startswith("mongodb://") or MONGO_URI.startswith("mongodb+srv:
     raise RuntimeError(f"FATAL: Invalid MONGO_URI format. Must start with 'mongodb://' or 'mongodb+srv://'. Got: {MONGO_URI[:20]}...")
 
 # Flask app initialization
+class DiskSpooledRequest(Request):
+    """Request that spools multipart file parts straight to disk instead of a 500KB memory buffer"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.TemporaryFile('wb+')
+
+
 app = Flask(__name__, static_folder='static', static_url_path='')
+app.request_class = DiskSpooledRequest
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.config["MONGO_URI"] = MONGO_URI
 app.config["SECRET_KEY"] = SECRET_KEY
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 
+try:
+    from utils.json_provider import ORJSONProvider
+    app.json = ORJSONProvider(app)
+except ImportError:  # Optional: encode jsonify responses with orjson
+    pass
+
 # CORS setup
 CORS(app)
 
+# Wire compression for MongoDB traffic; zstd only when the zstandard module is installed
+MONGO_COMPRESSORS = ['zlib']
+try:
+    import zstandard  # noqa: F401
+    MONGO_COMPRESSORS.insert(0, 'zstd')
+except ImportError:  # Optional: better ratio and speed than zlib
+    pass
+
 # Initialize MongoDB with error handling
 try:
-    mongo = PyMongo(app)
+    mongo = PyMongo(app, compressors=','.join(MONGO_COMPRESSORS), zlibCompressionLevel=6)
     # Test connection immediately
     mongo.db.command('ping')
     print("✓ MongoDB connection successful")
@@ -72,7 +124,7 @@ except Exception as e:
     # Extract cluster name from error if possible
     cluster_name = None
     if "DNS query name does not exist" in error_msg:
-        match = re.search(r'_mongodb\._tcp\.([^.]+)', error_msg)
+        match = _DNS_CLUSTER_RE.search(error_msg)
         if match:
             cluster_name = match.group(1)
     
@@ -123,18 +175,48 @@ app.pcap_service = pcap_service  # Make available to routes
 gemini_service = GeminiThreatIntelligence(mongo.db)
 app.gemini_service = gemini_service  # Make available to routes
 
+# Initialize blocklist/whitelist snapshot (loaded and watched at startup;
+# reloaded on lookup after IP_LIST_CACHE_TTL seconds when change streams are unavailable)
+IP_LIST_CACHE_TTL = int(os.getenv("IP_LIST_CACHE_TTL", "30"))
+ip_list_service = IpListService(mongo.db, ttl=IP_LIST_CACHE_TTL)
+app.ip_list_service = ip_list_service
+
+# Initialize dashboard counters (maintained on alert writes, read by /api/stats)
+stats_rollup_service = StatsRollupService(mongo.db)
+app.stats_rollup_service = stats_rollup_service
+
 # Initialize SocketIO
-async_mode = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode=async_mode, logger=False, engineio_logger=False)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, logger=False, engineio_logger=False)
 
 # Upload folder
 UPLOAD_FOLDER = 'uploads'
+UPLOAD_EXTENSIONS = ['pcap', 'pcapng', 'log', 'txt']
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Auto-block configuration
 AUTO_BLOCK_THRESHOLD = int(os.getenv("AUTO_BLOCK_THRESHOLD", "5"))
 AUTO_BLOCK_WINDOW_HOURS = int(os.getenv("AUTO_BLOCK_WINDOW_HOURS", "1"))
 
+# Alerts buffered per insert_many during uploads
+ALERT_INSERT_BATCH_SIZE = 1000
+
+# Most recent login attempts kept for credential-stuffing detection during an upload
+LOGIN_ATTEMPT_WINDOW = 500
+
+# Auto-block decisions run off the request path; IPs queued within this window are evaluated together
+AUTO_BLOCK_BATCH_WINDOW = 0.1  # seconds
+auto_block_queue = queue.Queue()
+
+# Independent IP lookups (geolocation, reputation, history) fan out on this pool;
+# callers wait at most IP_LOOKUP_TIMEOUT seconds and use None for stragglers
+IP_LOOKUP_TIMEOUT = 2  # seconds
+_ip_lookup_executor = ThreadPoolExecutor(max_workers=16)
+
+# Array-valued SocketIO events are buffered and flushed together at this interval
+EMIT_FLUSH_INTERVAL = 0.25  # seconds
+_pending_emits = {}
+_pending_emits_lock = threading.Lock()
+
 
 # ============================================
 # DATABASE INDEXES
@@ -145,17 +227,43 @@ def create_indexes():
     try:
         # Alerts indexes
         alerts_collection.create_index([("timestamp", -1)], name="timestamp_desc")
-        alerts_collection.create_index("src_ip", name="src_ip_index")
-        alerts_collection.create_index("attack_type", name="attack_type_index")
-        alerts_collection.create_index("confidence", name="confidence_index")
-        alerts_collection.create_index("status", name="status_index")
+        # Per-IP lookups: IP history and the Gemini threat-intel summary
         alerts_collection.create_index([("src_ip", 1), ("timestamp", -1)], name="ip_time_compound")
         
+        # Single-filter /api/alerts queries (always sorted by timestamp desc with a limit)
+        alerts_collection.create_index([("attack_type", 1), ("timestamp", -1)], name="attack_type_time")
+        alerts_collection.create_index([("status", 1), ("timestamp", -1)], name="status_time")
+        alerts_collection.create_index([("priority", 1), ("timestamp", -1)], name="priority_time")
+        alerts_collection.create_index([("confidence", -1), ("timestamp", -1)], name="confidence_time")
+        
+        # Equality-Sort-Range compound indexes for filtered, timestamp-sorted alert queries
+        alerts_collection.create_index(
+            [("status", 1), ("attack_type", 1), ("timestamp", -1)], name="status_attack_time"
+        )
+        alerts_collection.create_index(
+            [("src_ip", 1), ("status", 1), ("timestamp", -1)], name="ip_status_time"
+        )
+        
+        # Drop single-field indexes now served by a compound index prefix
+        existing_indexes = alerts_collection.index_information()
+        for redundant in ("src_ip_index", "status_index", "attack_type_index", "confidence_index"):
+            if redundant in existing_indexes:
+                alerts_collection.drop_index(redundant)
+        
         # Unique indexes for IP collections
         blocklist_collection.create_index("ip", unique=True, sparse=True, name="blocklist_ip")
         whitelist_collection.create_index("ip", unique=True, sparse=True, name="whitelist_ip")
-        ip_geolocation_collection.create_index("ip", unique=True, sparse=True, name="geo_ip")
-        ip_reputation_collection.create_index("ip", unique=True, sparse=True, name="rep_ip")
+        
+        # (ip, is_active) lets active-membership checks be answered from the index alone
+        blocklist_collection.create_index([("ip", 1), ("is_active", 1)], name="blocklist_ip_active")
+        whitelist_collection.create_index([("ip", 1), ("is_active", 1)], name="whitelist_ip_active")
+        
+        # Paged list views: active entries, newest first
+        blocklist_collection.create_index([("is_active", 1), ("created_at", -1)], name="blocklist_active_created")
+        whitelist_collection.create_index([("is_active", 1), ("created_at", -1)], name="whitelist_active_created")
+        
+        # IP cache indexes (lookup by ip, TTL expiry)
+        ensure_ip_indexes(mongo.db)
         
         # PCAP captures indexes
         pcap_captures_collection.create_index("capture_id", unique=True, name="capture_id_unique")
@@ -167,13 +275,14 @@ def create_indexes():
         gemini_threat_intel_collection.create_index("analysis_id", unique=True, name="analysis_id_unique")
         gemini_threat_intel_collection.create_index("alert_id", name="alert_id_index")
         gemini_threat_intel_collection.create_index("ip_address", name="ip_address_index")
-        gemini_threat_intel_collection.create_index("created_at", name="gemini_created_at_index")
+        gemini_service.create_indexes()
+        
+        # Stats rollup indexes
+        stats_rollup_service.create_indexes()
         
         print("✓ MongoDB indexes created successfully")
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ Index creation warning: {e}\n{traceback.format_exc()}\n")
+        app.logger.exception(f"Index creation warning: {e}")
 
 
 # ============================================
@@ -194,8 +303,7 @@ def set_security_headers(response):
             response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
             response.headers['Permissions-Policy'] = 'geolocation=(), microphone=(), camera=()'
     except Exception as e:
-        import sys
-        sys.stderr.write(f"Error setting security headers: {e}\n")
+        app.logger.error(f"Error setting security headers: {e}")
     
     return response
 
@@ -213,22 +321,18 @@ def not_found(error):
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
-    import sys
-    sys.stderr.write(f"Internal server error: {error}\n")
+    app.logger.error(f"Internal server error: {error}")
     return jsonify({'error': 'Internal server error'}), 500
 
 
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Handle all unhandled exceptions"""
-    import sys
-    import traceback
     try:
-        error_trace = traceback.format_exc()
-        sys.stderr.write(f"Unhandled exception: {e}\n{error_trace}\n")
+        app.logger.exception(f"Unhandled exception: {e}")
         return jsonify({'error': 'An error occurred', 'message': str(e)}), 500
     except Exception as handler_error:
-        sys.stderr.write(f"Error handler itself failed: {handler_error}\n")
+        app.logger.error(f"Error handler itself failed: {handler_error}")
         return Response('Internal Server Error', status=500, mimetype='text/plain')
 
 
@@ -238,87 +342,186 @@ def handle_exception(e):
 
 def check_ip_blocked(ip):
     """Check if IP is in blocklist"""
-    if not ip:
-        return False
-    blocked = blocklist_collection.find_one({"ip": ip, "is_active": True})
-    return blocked is not None
+    return ip_list_service.is_blocked(ip)
 
 
 def check_ip_whitelisted(ip):
     """Check if IP is whitelisted"""
-    if not ip:
-        return False
-    whitelisted = whitelist_collection.find_one({"ip": ip, "is_active": True})
-    return whitelisted is not None
+    return ip_list_service.is_whitelisted(ip)
 
 
-def should_auto_block(ip):
-    """Check if IP should be auto-blocked"""
-    if not ip or check_ip_whitelisted(ip):
-        return False
+def broadcast(event, data):
+    """Emit a SocketIO event to all connected clients (non-critical on failure)"""
+    try:
+        # Try emitting without namespace first (broadcast is default in python-socketio 5.x)
+        socketio.emit(event, data)
+    except (TypeError, AttributeError) as emit_error:
+        # If that fails, try with namespace
+        try:
+            socketio.emit(event, data, namespace='/')
+        except Exception:
+            # If all else fails, just log the error but don't fail the operation
+            app.logger.warning(f"SocketIO emit error (non-critical): {emit_error}")
+
+
+def queue_emit(event, items):
+    """Buffer items for an array-valued event; emit_flusher sends them as one frame"""
+    if not items:
+        return
+    with _pending_emits_lock:
+        _pending_emits.setdefault(event, []).extend(items)
+
+
+def emit_flusher():
+    """Background task: emit each buffered event as a single array every EMIT_FLUSH_INTERVAL"""
+    while True:
+        socketio.sleep(EMIT_FLUSH_INTERVAL)
+        with _pending_emits_lock:
+            if not _pending_emits:
+                continue
+            batches = dict(_pending_emits)
+            _pending_emits.clear()
+        for event, items in batches.items():
+            broadcast(event, items)
+
+
+def run_concurrently(tasks, timeout=IP_LOOKUP_TIMEOUT):
+    """
+    Run independent IO-bound lookups on the shared pool
     
-    # Count attacks in the last window
-    cutoff = datetime.utcnow() - timedelta(hours=AUTO_BLOCK_WINDOW_HOURS)
-    attack_count = alerts_collection.count_documents({
-        "src_ip": ip,
-        "timestamp": {"$gte": cutoff}
-    })
+    Args:
+        tasks: Dict mapping a key to a zero-argument callable
+        timeout: Seconds to wait for all of them together
     
-    if attack_count >= AUTO_BLOCK_THRESHOLD:
-        # Check if already blocked
-        existing = blocklist_collection.find_one({"ip": ip})
-        if not existing:
-            # Auto-block
-            block_doc = BlocklistDocument.create(
-                ip=ip,
-                reason=f'Auto-blocked after {attack_count} attacks in {AUTO_BLOCK_WINDOW_HOURS} hour(s)',
-                auto_blocked=True,
-                attack_count=attack_count
-            )
-            
-            try:
-                blocklist_collection.insert_one(block_doc)
-                block_doc['id'] = str(block_doc['_id'])
-                block_doc.pop('_id')
-                # Emit to all connected clients (broadcast is default in python-socketio 5.x)
-                try:
-                    # Try emitting without namespace first
-                    socketio.emit('ip_blocked', block_doc)
-                except (TypeError, AttributeError) as emit_error:
-                    # If that fails, try with namespace
-                    try:
-                        socketio.emit('ip_blocked', block_doc, namespace='/')
-                    except Exception:
-                        # If all else fails, just log the error but don't fail the operation
-                        import sys
-                        sys.stderr.write(f"⚠ SocketIO emit error (non-critical): {emit_error}\n")
-                print(f"✓ Auto-blocked IP: {ip} ({attack_count} attacks)")
-                return True
-            except Exception as e:
-                import sys
-                import traceback
-                sys.stderr.write(f"⚠ Auto-block failed for {ip}: {e}\n{traceback.format_exc()}\n")
-        elif not existing.get('is_active', True):
-            # Reactivate block
-            blocklist_collection.update_one(
-                {"ip": ip},
-                {"$set": {"is_active": True, "attack_count": attack_count}}
-            )
-            return True
+    Returns:
+        Dict mapping each key to its result (None on error or timeout)
+    """
+    futures = {key: _ip_lookup_executor.submit(task) for key, task in tasks.items()}
+    deadline = time.monotonic() + timeout
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            app.logger.warning(f"IP lookup {key} failed: {type(e).__name__}: {e}")
+            results[key] = None
+    return results
+
+
+@lru_cache(maxsize=1)
+def _auto_block_cutoff(second):
+    """Start of the auto-block window, computed once per wall-clock second"""
+    return datetime.fromtimestamp(second, timezone.utc).replace(tzinfo=None) - timedelta(hours=AUTO_BLOCK_WINDOW_HOURS)
+
+
+def recent_attack_counts(ips):
+    """Alerts per IP inside the auto-block window, for many IPs in one aggregation"""
+    pipeline = [
+        {"$match": {"src_ip": {"$in": list(ips)}, "timestamp": {"$gte": _auto_block_cutoff(int(time.time()))}}},
+        {"$group": {"_id": "$src_ip", "count": {"$sum": 1}}}
+    ]
+    return {doc['_id']: doc['count'] for doc in alerts_collection.aggregate(pipeline, hint="ip_time_compound")}
+
+
+def auto_block_ips(ips):
+    """
+    Auto-block every IP over the attack threshold in one bulk write
+    
+    Args:
+        ips: Iterable of source IPs that produced new alerts
     
-    return False
+    Returns:
+        List of newly created block documents (queued for the next 'ips_blocked' flush)
+    """
+    ips = [ip for ip in ips if ip and not check_ip_whitelisted(ip)]
+    if not ips:
+        return []
+    
+    ops = []
+    candidates = []
+    now = utcnow()
+    for ip, attack_count in recent_attack_counts(ips).items():
+        if attack_count < AUTO_BLOCK_THRESHOLD:
+            continue
+        
+        # Fields refreshed on every block; everything else is only written on insert
+        set_fields = {"is_active": True, "attack_count": attack_count}
+        block_doc = BlocklistDocument.create(
+            ip=ip,
+            reason=f'Auto-blocked after {attack_count} attacks in {AUTO_BLOCK_WINDOW_HOURS} hour(s)',
+            auto_blocked=True,
+            attack_count=attack_count,
+            now=now
+        )
+        for field in set_fields:
+            block_doc.pop(field, None)
+        
+        ops.append(UpdateOne({"ip": ip}, {"$setOnInsert": block_doc, "$set": set_fields}, upsert=True))
+        candidates.append((block_doc, set_fields))
+    
+    if not ops:
+        return []
+    
+    try:
+        result = blocklist_collection.bulk_write(ops, ordered=False)
+    except Exception as e:
+        app.logger.exception(f"Auto-block failed for {len(ops)} IP(s): {e}")
+        return []
+    
+    if result.upserted_count or result.modified_count:
+        ip_list_service.refresh()
+    
+    # upserted_ids maps op index -> _id of the newly inserted block
+    new_blocks = []
+    for index, block_id in result.upserted_ids.items():
+        block_doc, set_fields = candidates[index]
+        block_doc.update(set_fields)
+        block_doc['_id'] = block_id
+        new_blocks.append(BlocklistDocument.to_dict(block_doc))
+        print(f"✓ Auto-blocked IP: {block_doc['ip']} ({block_doc['attack_count']} attacks)")
+    
+    queue_emit('ips_blocked', new_blocks)
+    
+    return new_blocks
+
+
+def queue_auto_block(ips):
+    """Hand IPs to the background auto-block worker"""
+    for ip in ips:
+        auto_block_queue.put(ip)
+
+
+def auto_block_worker():
+    """Background task: drain queued IPs in short windows and auto-block each batch"""
+    while True:
+        batch = {auto_block_queue.get()}
+        deadline = time.monotonic() + AUTO_BLOCK_BATCH_WINDOW
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.add(auto_block_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            auto_block_ips(batch)
+        except Exception as e:
+            app.logger.exception(f"Auto-block worker error: {e}")
+
+
+# Priority bands: [0, 60) low, [60, 75) medium, [75, 90) high, [90, ...) critical
+_PRIORITY_THRESHOLDS = (60, 75, 90)
+_PRIORITY_LEVELS = ("low", "medium", "high", "critical")
+_PRIORITY_LUT = tuple(_PRIORITY_LEVELS[bisect_right(_PRIORITY_THRESHOLDS, c)] for c in range(101))
 
 
 def get_priority(confidence):
     """Calculate priority based on confidence score"""
-    if confidence >= 90:
-        return "critical"
-    elif confidence >= 75:
-        return "high"
-    elif confidence >= 60:
-        return "medium"
-    else:
-        return "low"
+    if type(confidence) is int and 0 <= confidence <= 100:
+        return _PRIORITY_LUT[confidence]
+    return _PRIORITY_LEVELS[bisect_right(_PRIORITY_THRESHOLDS, confidence)]
 
 
 # ============================================
@@ -351,7 +554,7 @@ def health_check():
     return jsonify({
         "status": "Running",
         "database": db_status,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": utcnow().isoformat()
     }), status_code
 
 
@@ -361,8 +564,7 @@ def media(filename):
     try:
         return send_from_directory(UPLOAD_FOLDER, filename)
     except Exception as e:
-        import sys
-        sys.stderr.write(f"Error serving media file {filename}: {e}\n")
+        app.logger.error(f"Error serving media file {filename}: {e}")
         return jsonify({'error': 'File not found'}), 404
 
 
@@ -389,45 +591,115 @@ def upload():
         fname = os.path.join(UPLOAD_FOLDER, secure_filename(f.filename))
         f.save(fname)
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"Error saving file: {e}\n{traceback.format_exc()}\n")
+        app.logger.exception(f"Error saving file: {e}")
         return jsonify({'error': f'Cannot save file: {str(e)}'}), 500
     
     # Validate file extension
     ext = f.filename.lower().split('.')[-1]
-    valid_extensions = ['pcap', 'pcapng', 'log', 'txt']
     
-    if ext not in valid_extensions:
+    if ext not in UPLOAD_EXTENSIONS:
         try:
             os.remove(fname)
         except:
             pass
-        return jsonify({'error': f'Invalid file type. Allowed: {", ".join(valid_extensions)}'}), 400
+        return jsonify({'error': f'Invalid file type. Allowed: {", ".join(UPLOAD_EXTENSIONS)}'}), 400
     
-    # Parse file
-    records = []
+    return analyze_upload(fname, ext)
+
+
+@app.route('/api/upload/stream', methods=['POST', 'PUT'])
+def upload_stream():
+    """Upload a raw (application/octet-stream) PCAP or log body, streamed straight to disk"""
+    filename = secure_filename(request.headers.get('X-Filename', ''))
+    if not filename:
+        return jsonify({'error': 'X-Filename header required'}), 400
+    
+    ext = filename.lower().split('.')[-1]
+    if ext not in UPLOAD_EXTENSIONS:
+        return jsonify({'error': f'Invalid file type. Allowed: {", ".join(UPLOAD_EXTENSIONS)}'}), 400
+    
+    max_size = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length and request.content_length > max_size:
+        return jsonify({'error': f'File size exceeds {max_size // 1024 // 1024}MB'}), 400
+    
+    # Save file in 64KB chunks - no multipart parsing, no temp-file copy
+    try:
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        fname = os.path.join(UPLOAD_FOLDER, filename)
+        with open(fname, 'wb') as out:
+            while chunk := request.stream.read(1 << 16):
+                out.write(chunk)
+    except Exception as e:
+        app.logger.exception(f"Error saving file: {e}")
+        try:
+            os.remove(fname)
+        except:
+            pass
+        return jsonify({'error': f'Cannot save file: {str(e)}'}), 500
+    
+    return analyze_upload(fname, ext)
+
+
+def analyze_upload(fname, ext):
+    """Run detection over a saved upload, store its alerts and return the API response"""
+    # Parse file lazily - records are streamed through detection, never held as a list
     try:
         if ext in ['pcap', 'pcapng']:
-            records = parse_pcap(fname)
+            records = iter_pcap(fname)
         else:
-            records = parse_access_log(fname)
+            records = iter_access_log(fname)
+        # Generators do nothing until iterated: pull the first record here so
+        # unreadable or malformed files are reported as parse errors
+        first = next(records, None)
     except Exception as e:
-        import traceback
-        import sys
-        error_trace = traceback.format_exc()
-        sys.stderr.write(f"Error parsing file: {e}\n{error_trace}\n")
+        app.logger.exception(f"Error parsing file: {e}")
         return jsonify({'error': f'Error parsing file: {str(e)}'}), 500
-    
-    if not records:
-        return jsonify({'error': 'No records found in file'}), 400
+    if first is not None:
+        records = chain((first,), records)
     
     # Process records
-    recent_login_attempts = []
+    recent_login_attempts = deque(maxlen=LOGIN_ATTEMPT_WINDOW)
     new_alerts = []
+    pending_docs = []
+    alerting_ips = set()
+    geo_by_ip = {}
+    batch_now = None
+    
+    def flush_alerts():
+        """Insert buffered alerts in one round trip and record their metadata"""
+        if not pending_docs:
+            return
+        
+        # Store geolocation on the alert so list/detail views need no lookup
+        unresolved = {doc['src_ip'] for doc in pending_docs if doc['src_ip'] and doc['src_ip'] not in geo_by_ip}
+        if unresolved:
+            resolved = bulk_geolocate_ips(list(unresolved), mongo.db, executor=_ip_lookup_executor)
+            for ip in unresolved:
+                geo_by_ip[ip] = resolved.get(ip)
+        for doc in pending_docs:
+            doc['geolocation'] = geo_by_ip.get(doc['src_ip'])
+        
+        # insert_many assigns _id on each document in place
+        alerts_collection.insert_many(pending_docs, ordered=False)
+        try:
+            stats_rollup_service.record_inserted(pending_docs)
+        except Exception as e:
+            app.logger.warning(f"Stats rollup update failed (reconcile with /api/stats?refresh=true): {e}")
+        for doc in pending_docs:
+            new_alerts.append({
+                'id': str(doc['_id']),
+                'attack': doc['attack_type'],
+                'confidence': doc['confidence'],
+                'priority': doc['priority'],
+                'src_ip': doc['src_ip']
+            })
+        pending_docs.clear()
+    
+    record_count = 0
     
     try:
         for r in records:
+            record_count += 1
             src_ip = r.get('src_ip', '')
             
             # Skip if whitelisted or blocked
@@ -439,7 +711,10 @@ def upload():
             
             for note, conf in alerts:
                 priority = get_priority(conf)
-                alert_doc = AlertDocument.create(
+                # One timestamp per insert batch
+                if not pending_docs:
+                    batch_now = utcnow()
+                pending_docs.append(AlertDocument.create(
                     attack_type=note,
                     url=r.get('url', ''),
                     src_ip=src_ip,
@@ -449,35 +724,26 @@ def upload():
                     http_method=r.get('method', ''),
                     params=str(r.get('params', '')),
                     user_agent=r.get('user_agent', ''),
-                    priority=priority
-                )
-                
-                result = alerts_collection.insert_one(alert_doc)
-                new_alerts.append({
-                    'id': str(result.inserted_id),
-                    'attack': note,
-                    'confidence': conf,
-                    'priority': priority,
-                    'src_ip': src_ip
-                })
+                    priority=priority,
+                    now=batch_now
+                ))
+                alerting_ips.add(src_ip)
                 
-                # Check for auto-block
-                should_auto_block(src_ip)
+                if len(pending_docs) >= ALERT_INSERT_BATCH_SIZE:
+                    flush_alerts()
+        
+        flush_alerts()
+        
+        if not record_count:
+            return jsonify({'error': 'No records found in file'}), 400
+        
+        # Auto-block is decided in the background, once per IP, after all alerts are stored
+        queue_auto_block(alerting_ips)
         
-        # Emit WebSocket notifications for high confidence alerts
-        for alert in new_alerts:
-            if alert['confidence'] >= 80:
-                try:
-                    # Try emitting without namespace first (python-socketio 5.x default)
-                    socketio.emit('new_alert', alert)
-                except (TypeError, AttributeError) as emit_error:
-                    # If that fails, try with namespace or just skip (non-critical)
-                    try:
-                        socketio.emit('new_alert', alert, namespace='/')
-                    except Exception:
-                        # Log but don't fail the upload - WebSocket is optional
-                        import sys
-                        sys.stderr.write(f"⚠ SocketIO emit error (non-critical): {emit_error}\n")
+        # Notify clients of all high confidence alerts in one event, off the response path
+        high_conf_alerts = [alert for alert in new_alerts if alert['confidence'] >= 80]
+        if high_conf_alerts:
+            socketio.start_background_task(broadcast, 'new_alerts_batch', {'alerts': high_conf_alerts})
         
         return jsonify({
             'success': True,
@@ -486,13 +752,37 @@ def upload():
         })
     
     except Exception as e:
-        import traceback
-        import sys
-        error_trace = traceback.format_exc()
-        sys.stderr.write(f"Upload error: {e}\nTraceback: {error_trace}\n")
+        app.logger.exception(f"Upload error: {e}")
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
 
+def _parse_iso(value):
+    """Parse an ISO 8601 query parameter ('Z' suffix allowed); None if absent, ValueError if malformed"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _timestamp_range(start_date, end_date):
+    """MongoDB timestamp range condition for optional ISO start/end bounds (None when unbounded)"""
+    start_dt = _parse_iso(start_date)
+    end_dt = _parse_iso(end_date)
+    timestamp_range = {}
+    if start_dt:
+        timestamp_range['$gte'] = start_dt
+    if end_dt:
+        timestamp_range['$lte'] = end_dt
+    return timestamp_range or None
+
+
+# Fields read by /api/alerts (everything else stays on the server)
+_ALERT_LIST_PROJECTION = {
+    '_id': 1, 'timestamp': 1, 'src_ip': 1, 'dst_ip': 1, 'http_method': 1, 'url': 1,
+    'attack_type': 1, 'confidence': 1, 'status': 1, 'priority': 1, 'notes': 1, 'geolocation': 1
+}
+_ALERT_LIST_PROJECTION_WITH_RAW = dict(_ALERT_LIST_PROJECTION, raw=1)
+
+
 @app.route('/api/alerts')
 def alerts_api():
     """Get alerts with advanced filtering"""
@@ -514,18 +804,12 @@ def alerts_api():
     query = {}
     
     # Date range
-    if start_date or end_date:
-        query['timestamp'] = {}
-        if start_date:
-            try:
-                query['timestamp']['$gte'] = datetime.fromisoformat(start_date.replace('Z', ''))
-            except:
-                pass
-        if end_date:
-            try:
-                query['timestamp']['$lte'] = datetime.fromisoformat(end_date.replace('Z', ''))
-            except:
-                pass
+    try:
+        timestamp_range = _timestamp_range(start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid start_date/end_date (expected ISO 8601)'}), 400
+    if timestamp_range:
+        query['timestamp'] = timestamp_range
     
     # Attack types
     if attack_types:
@@ -553,33 +837,50 @@ def alerts_api():
     if ip_filter:
         query['src_ip'] = ip_filter
     
+    # CIDR filter - matched by MongoDB (src_ip prefix of ip_time_compound) so limit applies after filtering
+    cidr_regex = None
+    if cidr_filter:
+        try:
+            cidr_regex = cidr_to_regex(cidr_filter)
+        except ValueError:
+            return jsonify({'error': f'Invalid CIDR: {cidr_filter}'}), 400
+        if cidr_regex:
+            if ip_filter:
+                query['src_ip'] = {"$eq": ip_filter, "$regex": cidr_regex}
+            else:
+                query['src_ip'] = {"$regex": cidr_regex}
+    
     # URL filter (partial match)
     if url_filter:
         query['url'] = {"$regex": url_filter, "$options": "i"}
     
     # Execute query
     try:
-        alerts = list(alerts_collection.find(query).sort("timestamp", -1).limit(limit))
+        # 'raw' can be large and the list view does not show it; alert_detail always returns it
+        include_raw = request.args.get('include_raw', 'false').lower() == 'true'
+        projection = _ALERT_LIST_PROJECTION_WITH_RAW if include_raw else _ALERT_LIST_PROJECTION
+        alerts = list(alerts_collection.find(query, projection).sort("timestamp", -1).limit(limit))
+        
+        # IPv6 ranges have no regex form and are still filtered here, in one pass over the page
+        if cidr_filter and not cidr_regex:
+            in_range = ips_in_any_cidr([r.get('src_ip') or '' for r in alerts], build_cidr_index([cidr_filter], version=6), version=6)
+            alerts = [r for r, hit in zip(alerts, in_range) if hit or not r.get('src_ip')]
         
         out = []
         # Get geolocation only if requested (to avoid timeouts)
         include_geo = request.args.get('include_geo', 'false').lower() == 'true'
         
+        # Resolve each missing IP once, however many alerts share it, concurrently
+        geo_map = {}
+        if include_geo:
+            missing = {r['src_ip'] for r in alerts if r.get('geolocation') is None and r.get('src_ip')}
+            geo_map = run_concurrently({ip: partial(get_ip_geolocation, ip, mongo.db) for ip in missing})
+        
         for r in alerts:
-            # Apply CIDR filter if specified (do this first to avoid unnecessary processing)
-            if cidr_filter and r.get('src_ip'):
-                if not check_ip_in_cidr(r['src_ip'], cidr_filter):
-                    continue
-            
-            # Get geolocation only if requested (to avoid timeouts on large result sets)
-            geo = None
-            if include_geo and r.get('src_ip'):
-                try:
-                    geo = get_ip_geolocation(r['src_ip'])
-                except Exception as geo_error:
-                    import sys
-                    sys.stderr.write(f"Geolocation error for {r.get('src_ip')}: {geo_error}\n")
-                    geo = None
+            # Geolocation stored at upload time; otherwise from the lookups above (only if requested)
+            geo = r.get('geolocation')
+            if geo is None:
+                geo = geo_map.get(r.get('src_ip'))
             
             alert_data = {
                 'id': str(r['_id']),
@@ -590,33 +891,29 @@ def alerts_api():
                 'url': r.get('url', ''),
                 'attack': r.get('attack_type', ''),
                 'confidence': r.get('confidence', 0),
-                'raw': r.get('raw', ''),
                 'status': r.get('status', 'new'),
                 'priority': r.get('priority', 'medium'),
                 'notes': r.get('notes', ''),
                 'geolocation': geo
             }
+            if include_raw:
+                alert_data['raw'] = r.get('raw', '')
             
             out.append(alert_data)
         
         return jsonify(out)
     
     except Exception as e:
-        import sys
-        import traceback
-        # FIXED: Better error logging with full traceback
-        error_trace = traceback.format_exc()
-        sys.stderr.write(f"Alerts API error: {type(e).__name__}: {e}\n{error_trace}\n")
+        app.logger.exception(f"Alerts API error: {type(e).__name__}: {e}")
         return jsonify({'error': f'{type(e).__name__}: {str(e)}'}), 500
 
 
 @app.route('/api/alerts/<alert_id>', methods=['GET', 'PATCH', 'DELETE'])
 def alert_detail(alert_id):
     """Get, update, or delete a specific alert"""
-    try:
-        obj_id = ObjectId(alert_id)
-    except:
+    if not _OID_RE.fullmatch(alert_id):
         return jsonify({'error': 'Invalid alert ID'}), 400
+    obj_id = ObjectId(alert_id)
     
     alert = alerts_collection.find_one({"_id": obj_id})
     if not alert:
@@ -624,20 +921,18 @@ def alert_detail(alert_id):
     
     if request.method == 'GET':
         # FIXED: Better error handling for IP services
-        geo = None
+        geo = alert.get('geolocation')
         rep = None
-        if alert.get('src_ip'):
-            try:
-                geo = get_ip_geolocation(alert.get('src_ip'))
-            except Exception as geo_error:
-                import sys
-                sys.stderr.write(f"Geolocation error: {geo_error}\n")
-            
-            try:
-                rep = get_ip_reputation(alert.get('src_ip'))
-            except Exception as rep_error:
-                import sys
-                sys.stderr.write(f"Reputation error: {rep_error}\n")
+        src_ip = alert.get('src_ip')
+        if src_ip:
+            # Geolocation (if not stored) and reputation are fetched in parallel
+            tasks = {'reputation': partial(get_ip_reputation, src_ip, mongo.db)}
+            if geo is None:
+                tasks['geolocation'] = partial(get_ip_geolocation, src_ip, mongo.db)
+            lookups = run_concurrently(tasks)
+            rep = lookups['reputation']
+            if geo is None:
+                geo = lookups['geolocation']
         
         return jsonify({
             'id': str(alert['_id']),
@@ -658,20 +953,27 @@ def alert_detail(alert_id):
     
     elif request.method == 'PATCH':
         data = request.get_json()
-        update_doc = {"$set": {"updated_at": datetime.utcnow()}}
+        update_doc = {"$set": {"updated_at": utcnow()}}
         
         for field in ['status', 'priority', 'notes']:
             if field in data:
                 update_doc['$set'][field] = data[field]
         
         alerts_collection.update_one({"_id": obj_id}, update_doc)
+        previous = Counter({(alert.get('status', 'new'), alert.get('priority', 'medium')): 1})
+        stats_rollup_service.record_updates(previous, update_doc['$set'])
         return jsonify({'success': True})
     
     elif request.method == 'DELETE':
-        alerts_collection.delete_one({"_id": obj_id})
+        if alerts_collection.delete_one({"_id": obj_id}).deleted_count:
+            stats_rollup_service.record_deleted(alert)
         return jsonify({'success': True})
 
 
+# Alert IDs per update_many in bulk updates
+BULK_UPDATE_BATCH_SIZE = 1000
+
+
 @app.route('/api/alerts/bulk', methods=['PATCH'])
 def bulk_update_alerts():
     """Bulk update alerts"""
@@ -679,76 +981,59 @@ def bulk_update_alerts():
     alert_ids = data.get('alert_ids', [])
     updates = data.get('updates', {})
     
-    try:
-        obj_ids = [ObjectId(aid) for aid in alert_ids]
-    except:
-        return jsonify({'error': 'Invalid alert ID format'}), 400
+    # Validate every ID up front so the response names the bad ones
+    invalid = [aid for aid in alert_ids if not isinstance(aid, str) or not _OID_RE.fullmatch(aid)]
+    if invalid:
+        return jsonify({'error': 'Invalid alert ID format', 'invalid_ids': invalid[:50]}), 400
+    obj_ids = [ObjectId(aid) for aid in alert_ids]
     
-    update_doc = {"$set": {"updated_at": datetime.utcnow()}}
+    update_doc = {"$set": {"updated_at": utcnow()}}
     for field in ['status', 'priority']:
         if field in updates:
             update_doc['$set'][field] = updates[field]
     
-    result = alerts_collection.update_many({"_id": {"$in": obj_ids}}, update_doc)
-    return jsonify({'success': True, 'updated': result.modified_count})
+    # Chunked so each update_many filter stays well under the 16MB BSON limit
+    modified = 0
+    for start in range(0, len(obj_ids), BULK_UPDATE_BATCH_SIZE):
+        batch = obj_ids[start:start + BULK_UPDATE_BATCH_SIZE]
+        previous = stats_rollup_service.field_counts(batch)
+        modified += alerts_collection.update_many({"_id": {"$in": batch}}, update_doc).modified_count
+        stats_rollup_service.record_updates(previous, update_doc['$set'])
+    return jsonify({'success': True, 'updated': modified})
 
 
 @app.route('/api/stats')
 def stats_api():
     """Get dashboard statistics"""
     try:
-        from bson.son import SON
-        
-        # Total alerts
-        total_alerts = alerts_collection.count_documents({})
-        
-        # High confidence alerts
-        high_conf = alerts_collection.count_documents({"confidence": {"$gte": 80}})
-        
-        # Recent activity (last 24 hours)
-        cutoff = datetime.utcnow() - timedelta(hours=24)
-        recent = alerts_collection.count_documents({"timestamp": {"$gte": cutoff}})
+        # Total alerts (unfiltered, so collection metadata is enough)
+        total_alerts = alerts_collection.estimated_document_count()
         
-        # Attack type distribution
-        attack_dist_pipeline = [
-            {"$group": {"_id": "$attack_type", "count": {"$sum": 1}}},
-            {"$sort": SON([("count", -1)])}
-        ]
-        attack_types = list(alerts_collection.aggregate(attack_dist_pipeline))
-        attack_dist = {item['_id']: item['count'] for item in attack_types}
+        # Counters maintained on alert writes; ?refresh=true recomputes them from the alerts
+        # (skipped while another rebuild runs or one finished in the last REFRESH_MIN_INTERVAL seconds)
+        if request.args.get('refresh', 'false').lower() == 'true':
+            stats_rollup_service.rebuild(min_interval=REFRESH_MIN_INTERVAL)
+        rollup = stats_rollup_service.read()
         
-        # Status distribution
-        status_dist_pipeline = [
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-        ]
-        status_types = list(alerts_collection.aggregate(status_dist_pipeline))
-        status_counts = {item['_id']: item['count'] for item in status_types}
+        high_conf = rollup['high_conf']
+        recent = rollup['recent']
+        attack_dist = rollup['attack']
+        status_counts = rollup['status']
+        priority_counts = rollup['priority']
+        top_ips = rollup['top_ips']
         
-        # Priority distribution
-        priority_dist_pipeline = [
-            {"$group": {"_id": "$priority", "count": {"$sum": 1}}}
-        ]
-        priority_types = list(alerts_collection.aggregate(priority_dist_pipeline))
-        priority_counts = {item['_id']: item['count'] for item in priority_types}
+        # Country stored on the alerts at upload; look up older alerts without it concurrently
+        geo_map = run_concurrently({
+            item['_id']: partial(get_ip_geolocation, item['_id'], mongo.db)
+            for item in top_ips if not item.get('country')
+        })
         
-        # Top attacking IPs
-        top_ips_pipeline = [
-            {"$match": {"src_ip": {"$ne": None, "$ne": ""}}},
-            {"$group": {"_id": "$src_ip", "count": {"$sum": 1}}},
-            {"$sort": SON([("count", -1)])},
-            {"$limit": 10}
-        ]
-        top_ips = list(alerts_collection.aggregate(top_ips_pipeline))
         ip_stats = []
         for item in top_ips:
-            # FIXED: Better error handling for geolocation
-            try:
-                geo = get_ip_geolocation(item['_id'])
+            country = item.get('country')
+            if not country:
+                geo = geo_map.get(item['_id'])
                 country = geo.get('country', 'Unknown') if geo else 'Unknown'
-            except Exception as geo_error:
-                import sys
-                sys.stderr.write(f"Geolocation error for {item['_id']}: {geo_error}\n")
-                country = 'Unknown'
             
             ip_stats.append({
                 'ip': item['_id'],
@@ -767,39 +1052,22 @@ def stats_api():
         })
     
     except Exception as e:
-        import sys
-        import traceback
-        # FIXED: Better error logging with full traceback
-        error_trace = traceback.format_exc()
-        sys.stderr.write(f"Stats API error: {type(e).__name__}: {e}\n{error_trace}\n")
+        app.logger.exception(f"Stats API error: {type(e).__name__}: {e}")
         return jsonify({'error': f'{type(e).__name__}: {str(e)}'}), 500
 
 
 @app.route('/api/ip/<ip>')
 def ip_info(ip):
     """Get IP information"""
-    # FIXED: Better error handling
-    geo = None
-    rep = None
-    history = None
-    
-    try:
-        geo = get_ip_geolocation(ip)
-    except Exception as e:
-        import sys
-        sys.stderr.write(f"Geolocation error for {ip}: {e}\n")
-    
-    try:
-        rep = get_ip_reputation(ip)
-    except Exception as e:
-        import sys
-        sys.stderr.write(f"Reputation error for {ip}: {e}\n")
-    
-    try:
-        history = get_ip_history(ip)
-    except Exception as e:
-        import sys
-        sys.stderr.write(f"History error for {ip}: {e}\n")
+    # Independent lookups run in parallel; each is None if it fails or times out
+    lookups = run_concurrently({
+        'geolocation': partial(get_ip_geolocation, ip, mongo.db),
+        'reputation': partial(get_ip_reputation, ip, mongo.db),
+        'history': partial(get_ip_history, ip, mongo.db)
+    })
+    geo = lookups['geolocation']
+    rep = lookups['reputation']
+    history = lookups['history']
     
     is_blocked = check_ip_blocked(ip)
     is_whitelisted = check_ip_whitelisted(ip)
@@ -814,38 +1082,130 @@ def ip_info(ip):
     })
 
 
+IP_BATCH_MAX = 500
+
+
+def _ip_batch_error(ips):
+    """Validation error for the 'ips' list of a batch IP endpoint, or None"""
+    if not isinstance(ips, list) or not ips:
+        return jsonify({'error': 'ips must be a non-empty list'}), 400
+    if len(ips) > IP_BATCH_MAX:
+        return jsonify({'error': f'At most {IP_BATCH_MAX} IPs per request'}), 400
+    return None
+
+
+@app.route('/api/ip/history', methods=['POST'])
+def ip_history_bulk():
+    """Attack history for several IPs in one request: {"ips": [...], "limit": 50}"""
+    data = request.get_json(silent=True) or {}
+    ips = data.get('ips')
+    error = _ip_batch_error(ips)
+    if error:
+        return error
+    
+    try:
+        per_ip = min(max(int(data.get('limit', 50)), 1), 50)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    return jsonify(get_ip_history_bulk(ips, mongo.db, per_ip))
+
+
+@app.route('/api/ip/reputation', methods=['POST'])
+def ip_reputation_bulk():
+    """Reputation for several IPs in one request: {"ips": [...]}"""
+    data = request.get_json(silent=True) or {}
+    ips = data.get('ips')
+    error = _ip_batch_error(ips)
+    if error:
+        return error
+    
+    return jsonify(bulk_get_ip_reputation([ip for ip in ips if isinstance(ip, str)], mongo.db))
+
+
+def _page_args(default_limit=500, max_limit=5000):
+    """limit/skip query parameters for paged list endpoints"""
+    limit = min(max(request.args.get('limit', type=int, default=default_limit), 1), max_limit)
+    skip = max(request.args.get('skip', type=int, default=0), 0)
+    return limit, skip
+
+
+def _is_ip_or_cidr(value):
+    """True for a string holding a valid IP address or CIDR range"""
+    if not isinstance(value, str):
+        return False
+    if is_valid_ip(value):
+        return True
+    if '/' not in value:
+        return False
+    try:
+        ipaddress.ip_network(value, strict=False)
+        return True
+    except ValueError:
+        return False
+
+
+def _requested_ips(data):
+    """
+    IPs from a blocklist/whitelist POST body: {"ip": ...} or {"ips": [...]}
+    
+    Returns:
+        (ips, None) with duplicates removed, or (None, error response) when the body is invalid
+    """
+    if not isinstance(data, dict) or not (data.get('ips') or data.get('ip')):
+        return None, (jsonify({'error': 'IP address required'}), 400)
+    ips = data['ips'] if data.get('ips') else [data['ip']]
+    error = _ip_batch_error(ips)
+    if error:
+        return None, error
+    invalid = next((ip for ip in ips if not _is_ip_or_cidr(ip)), None)
+    if invalid is not None:
+        return None, (jsonify({'error': f'Invalid IP address or CIDR: {invalid!r}'}), 400)
+    return list(dict.fromkeys(ips)), None
+
+
+def _ip_list_upsert(doc):
+    """Upsert for a blocklist/whitelist document: (re)activate with a new reason, keep the rest on insert"""
+    set_fields = {"is_active": True, "reason": doc['reason']}
+    on_insert = {field: value for field, value in doc.items() if field not in set_fields}
+    return UpdateOne({"ip": doc['ip']}, {"$set": set_fields, "$setOnInsert": on_insert}, upsert=True)
+
+
 @app.route('/api/blocklist', methods=['GET', 'POST'])
 def blocklist_api():
     """Get or add to blocklist"""
     if request.method == 'GET':
-        blocks = list(blocklist_collection.find({"is_active": True}))
-        return jsonify([{
-            'id': str(b['_id']),
-            'ip': b['ip'],
-            'reason': b.get('reason', ''),
-            'auto_blocked': b.get('auto_blocked', False),
-            'attack_count': b.get('attack_count', 0),
-            'created_at': b['created_at'].isoformat() if 'created_at' in b else ''
-        } for b in blocks])
+        limit, skip = _page_args()
+        blocks = blocklist_collection.find(
+            {"is_active": True},
+            {"ip": 1, "reason": 1, "auto_blocked": 1, "attack_count": 1, "created_at": 1}
+        ).sort("created_at", -1).skip(skip).limit(limit)
+        return jsonify({
+            'items': [{
+                'id': str(b['_id']),
+                'ip': b['ip'],
+                'reason': b.get('reason', ''),
+                'auto_blocked': b.get('auto_blocked', False),
+                'attack_count': b.get('attack_count', 0),
+                'created_at': b['created_at'].isoformat() if 'created_at' in b else ''
+            } for b in blocks],
+            'total': blocklist_collection.count_documents({"is_active": True})
+        })
     
     elif request.method == 'POST':
-        data = request.get_json()
-        ip = data.get('ip')
+        data = request.get_json(silent=True)
+        ips, error = _requested_ips(data)
+        if error:
+            return error
         reason = data.get('reason', 'Manually blocked')
         
-        existing = blocklist_collection.find_one({"ip": ip})
-        if existing:
-            blocklist_collection.update_one(
-                {"ip": ip},
-                {"$set": {"is_active": True, "reason": reason}}
-            )
-        else:
-            block_doc = BlocklistDocument.create(
-                ip=ip,
-                reason=reason,
-                auto_blocked=False
-            )
-            blocklist_collection.insert_one(block_doc)
+        # One upsert per IP, all in a single round trip
+        now = utcnow()
+        blocklist_collection.bulk_write([
+            _ip_list_upsert(BlocklistDocument.create(ip=ip, reason=reason, auto_blocked=False, now=now))
+            for ip in ips
+        ], ordered=False)
+        ip_list_service.refresh()
         
         return jsonify({'success': True})
 
@@ -853,10 +1213,9 @@ def blocklist_api():
 @app.route('/api/blocklist/<block_id>', methods=['DELETE'])
 def unblock_ip(block_id):
     """Remove from blocklist"""
-    try:
-        obj_id = ObjectId(block_id)
-    except:
+    if not _OID_RE.fullmatch(block_id):
         return jsonify({'error': 'Invalid ID'}), 400
+    obj_id = ObjectId(block_id)
     
     result = blocklist_collection.update_one(
         {"_id": obj_id},
@@ -865,6 +1224,7 @@ def unblock_ip(block_id):
     
     if result.matched_count == 0:
         return jsonify({'error': 'Not found'}), 404
+    ip_list_service.refresh()
     
     return jsonify({'success': True})
 
@@ -873,31 +1233,35 @@ def unblock_ip(block_id):
 def whitelist_api():
     """Get or add to whitelist"""
     if request.method == 'GET':
-        whitelist = list(whitelist_collection.find({"is_active": True}))
-        return jsonify([{
-            'id': str(w['_id']),
-            'ip': w['ip'],
-            'reason': w.get('reason', ''),
-            'created_at': w['created_at'].isoformat() if 'created_at' in w else ''
-        } for w in whitelist])
+        limit, skip = _page_args()
+        whitelist = whitelist_collection.find(
+            {"is_active": True},
+            {"ip": 1, "reason": 1, "created_at": 1}
+        ).sort("created_at", -1).skip(skip).limit(limit)
+        return jsonify({
+            'items': [{
+                'id': str(w['_id']),
+                'ip': w['ip'],
+                'reason': w.get('reason', ''),
+                'created_at': w['created_at'].isoformat() if 'created_at' in w else ''
+            } for w in whitelist],
+            'total': whitelist_collection.count_documents({"is_active": True})
+        })
     
     elif request.method == 'POST':
-        data = request.get_json()
-        ip = data.get('ip')
+        data = request.get_json(silent=True)
+        ips, error = _requested_ips(data)
+        if error:
+            return error
         reason = data.get('reason', 'Manually whitelisted')
         
-        existing = whitelist_collection.find_one({"ip": ip})
-        if existing:
-            whitelist_collection.update_one(
-                {"ip": ip},
-                {"$set": {"is_active": True, "reason": reason}}
-            )
-        else:
-            whitelist_doc = WhitelistDocument.create(
-                ip=ip,
-                reason=reason
-            )
-            whitelist_collection.insert_one(whitelist_doc)
+        # One upsert per IP, all in a single round trip
+        now = utcnow()
+        whitelist_collection.bulk_write([
+            _ip_list_upsert(WhitelistDocument.create(ip=ip, reason=reason, now=now))
+            for ip in ips
+        ], ordered=False)
+        ip_list_service.refresh()
         
         return jsonify({'success': True})
 
@@ -905,10 +1269,9 @@ def whitelist_api():
 @app.route('/api/whitelist/<whitelist_id>', methods=['DELETE'])
 def remove_whitelist(whitelist_id):
     """Remove from whitelist"""
-    try:
-        obj_id = ObjectId(whitelist_id)
-    except:
+    if not _OID_RE.fullmatch(whitelist_id):
         return jsonify({'error': 'Invalid ID'}), 400
+    obj_id = ObjectId(whitelist_id)
     
     result = whitelist_collection.update_one(
         {"_id": obj_id},
@@ -917,10 +1280,33 @@ def remove_whitelist(whitelist_id):
     
     if result.matched_count == 0:
         return jsonify({'error': 'Not found'}), 404
+    ip_list_service.refresh()
     
     return jsonify({'success': True})
 
 
+# Fields (in column order) written by /api/export
+_EXPORT_FIELDS = ['id', 'timestamp', 'src_ip', 'url', 'attack', 'confidence', 'status', 'priority']
+_EXPORT_PROJECTION = {
+    '_id': 1, 'timestamp': 1, 'src_ip': 1, 'url': 1,
+    'attack_type': 1, 'confidence': 1, 'status': 1, 'priority': 1
+}
+
+
+def _export_row(r):
+    """Flatten an alert document into an export row"""
+    return {
+        'id': str(r['_id']),
+        'timestamp': r['timestamp'].isoformat() if isinstance(r['timestamp'], datetime) else str(r['timestamp']),
+        'src_ip': r.get('src_ip', ''),
+        'url': r.get('url', ''),
+        'attack': r.get('attack_type', ''),
+        'confidence': r.get('confidence', 0),
+        'status': r.get('status', 'new'),
+        'priority': r.get('priority', 'medium')
+    }
+
+
 @app.route('/api/export')
 def export():
     """Export alerts"""
@@ -930,59 +1316,60 @@ def export():
     
     # Build query
     query = {}
-    if start_date or end_date:
-        query['timestamp'] = {}
-        if start_date:
-            try:
-                query['timestamp']['$gte'] = datetime.fromisoformat(start_date.replace('Z', ''))
-            except:
-                pass
-        if end_date:
-            try:
-                query['timestamp']['$lte'] = datetime.fromisoformat(end_date.replace('Z', ''))
-            except:
-                pass
+    try:
+        timestamp_range = _timestamp_range(start_date, end_date)
+    except ValueError:
+        return jsonify({'error': 'Invalid start_date/end_date (expected ISO 8601)'}), 400
+    if timestamp_range:
+        query['timestamp'] = timestamp_range
     
     try:
-        alerts = list(alerts_collection.find(query))
-        
-        data = []
-        for r in alerts:
-            data.append({
-                'id': str(r['_id']),
-                'timestamp': r['timestamp'].isoformat() if isinstance(r['timestamp'], datetime) else str(r['timestamp']),
-                'src_ip': r.get('src_ip', ''),
-                'url': r.get('url', ''),
-                'attack': r.get('attack_type', ''),
-                'confidence': r.get('confidence', 0),
-                'status': r.get('status', 'new'),
-                'priority': r.get('priority', 'medium')
-            })
-        
-        if not data:
-            return jsonify({'error': 'No data to export'}), 404
-        
-        df = pd.DataFrame(data)
-        buf = io.BytesIO()
+        # Only the exported fields cross the wire
+        cursor = alerts_collection.find(query, _EXPORT_PROJECTION).batch_size(1000)
         
         if fmt == 'csv':
-            df.to_csv(buf, index=False)
-            buf.seek(0)
-            return send_file(buf, mimetype='text/csv', as_attachment=True, download_name='alerts.csv')
+            first = next(cursor, None)
+            if first is None:
+                return jsonify({'error': 'No data to export'}), 404
+            
+            def generate():
+                """Write CSV rows straight from the cursor, one chunk per row"""
+                buf = io.StringIO()
+                writer = csv.DictWriter(buf, fieldnames=_EXPORT_FIELDS)
+                writer.writeheader()
+                writer.writerow(_export_row(first))
+                yield buf.getvalue()
+                
+                for r in cursor:
+                    buf.seek(0)
+                    buf.truncate()
+                    writer.writerow(_export_row(r))
+                    yield buf.getvalue()
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype='text/csv',
+                headers={'Content-Disposition': 'attachment; filename=alerts.csv'}
+            )
         
-        elif fmt == 'pdf':
-            # Use your existing PDF generator
-            pdf_buffer = generate_pdf_report(data, [], None)
+        if fmt == 'pdf':
+            first = next(cursor, None)
+            if first is None:
+                return jsonify({'error': 'No data to export'}), 404
+            
+            # The report consumes rows in one pass, so the export is never held as a list
+            rows = (_export_row(r) for r in chain((first,), cursor))
+            pdf_buffer = generate_pdf_report(rows, [], None)
             filename = f'alerts_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
             return send_file(pdf_buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
         
-        else:
-            return jsonify({'data': data})
+        data = [_export_row(r) for r in cursor]
+        if not data:
+            return jsonify({'error': 'No data to export'}), 404
+        return jsonify({'data': data})
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"Export error: {e}\n{traceback.format_exc()}\n")
+        app.logger.exception(f"Export error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1015,40 +1402,61 @@ app.register_blueprint(gemini_bp)
 # REACT FRONTEND ROUTES (CATCH-ALL)
 # ============================================
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+# Set ENABLE_STATIC_FALLBACK=false when a reverse proxy serves the built frontend
+# (e.g. nginx: root /app/static; try_files $uri /index.html) and Flask only handles /api
+ENABLE_STATIC_FALLBACK = os.getenv('ENABLE_STATIC_FALLBACK', 'true').lower() == 'true'
+
+
+def _static_asset_names(static_path):
+    """Relative paths of the built frontend files, captured once at startup"""
+    names = set()
+    for root, _dirs, files in os.walk(static_path):
+        for filename in files:
+            names.add(os.path.relpath(os.path.join(root, filename), static_path).replace(os.sep, '/'))
+    return frozenset(names)
+
+
+_STATIC_PATH = app.static_folder or 'static'
+_STATIC_ASSETS = _static_asset_names(_STATIC_PATH)
+
+
 def serve_react(path):
     """Serve React static files"""
-    static_path = app.static_folder or 'static'
-    
-    # Serve specific file if it exists
-    if path != '' and os.path.exists(os.path.join(static_path, path)):
+    # Serve specific file if it was built
+    if path in _STATIC_ASSETS:
         try:
-            return send_from_directory(static_path, path)
+            return send_from_directory(_STATIC_PATH, path)
         except Exception as e:
-            import sys
-            sys.stderr.write(f"Error serving static file {path}: {e}\n")
+            app.logger.error(f"Error serving static file {path}: {e}")
             return jsonify({'error': 'File not found'}), 404
     
     # Serve React app for client-side routing
-    index_path = os.path.join(static_path, 'index.html')
-    if os.path.exists(index_path):
+    if 'index.html' in _STATIC_ASSETS:
         try:
-            return send_from_directory(static_path, 'index.html')
+            return send_from_directory(_STATIC_PATH, 'index.html')
         except Exception as e:
-            import sys
-            sys.stderr.write(f"Error serving index.html: {e}\n")
+            app.logger.error(f"Error serving index.html: {e}")
             return jsonify({'error': 'Frontend not built'}), 404
     else:
         return jsonify({'error': 'Frontend not built. Please build the React app first.'}), 404
 
 
+if ENABLE_STATIC_FALLBACK:
+    app.add_url_rule('/', 'serve_react', serve_react, defaults={'path': ''})
+    app.add_url_rule('/<path:path>', 'serve_react', serve_react)
+
+
 # ============================================
 # APPLICATION STARTUP
 # ============================================
 
 with app.app_context():
     create_indexes()
+    stats_rollup_service.ensure_initialized()
+
+ip_list_service.start(socketio.start_background_task)
+socketio.start_background_task(auto_block_worker)
+socketio.start_background_task(emit_flusher)
 
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_DEBUG', '0') == '1' or os.environ.get('FLASK_ENV') == 'development'
@@ -1059,6 +1467,11 @@ if __name__ == '__main__':
     else:
         print("✓ Running in PRODUCTION mode")
     
-    print(f"✓ Server starting on port {port}")
+    print(f"✓ Server starting on port {port} (async mode: {ASYNC_MODE})")
+    
+    run_kwargs = {}
+    if ASYNC_MODE == 'threading':
+        # Werkzeug dev server is only used in threading mode
+        run_kwargs['allow_unsafe_werkzeug'] = True
     
-    socketio.run(app, debug=debug_mode, host='0.0.0.0', port=port, allow_unsafe_werkzeug=True)
+    socketio.run(app, debug=debug_mode, host='0.0.0.0', port=port, **run_kwargs)
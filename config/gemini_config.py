@@ -12,6 +12,9 @@ TEMPERATURE = float(os.getenv("GEMINI_TEMPERATURE", "0.3"))
 # Caching Configuration
 CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))  # 1 hour in seconds
 
+# Stored analyses (which double as the response cache) are purged by a TTL index after this long
+ANALYSIS_RETENTION = int(os.getenv("GEMINI_ANALYSIS_RETENTION", str(30 * 24 * 3600)))  # 30 days in seconds
+
 # Rate Limiting
 RATE_LIMIT_PER_MINUTE = int(os.getenv("GEMINI_RATE_LIMIT_PER_MINUTE", "60"))
 
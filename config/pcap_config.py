@@ -10,6 +10,10 @@ from pathlib import Path
 PCAP_STORAGE_PATH = os.getenv("PCAP_STORAGE_PATH", "./pcap_captures/")
 Path(PCAP_STORAGE_PATH).mkdir(parents=True, exist_ok=True)
 
+# Internal nginx location aliasing PCAP_STORAGE_PATH (e.g. "/pcap-internal/"); when set,
+# downloads are handed to nginx with X-Accel-Redirect instead of being streamed by a worker
+PCAP_ACCEL_REDIRECT_PREFIX = os.getenv("PCAP_ACCEL_REDIRECT_PREFIX", "")
+
 # Capture limits
 MAX_CAPTURE_DURATION = int(os.getenv("MAX_CAPTURE_DURATION", "3600"))  # 1 hour in seconds
 MAX_CONCURRENT_CAPTURES = int(os.getenv("MAX_CONCURRENT_CAPTURES", "5"))
@@ -1,6 +1,16 @@
 import re
+from collections import Counter
 from urllib.parse import unquote, urlparse, parse_qs
 
+# Precompiled patterns (run_all is called once per parsed record)
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_EVENT_HANDLER_RE = re.compile(r'on\w+\s*=\s*"', re.I)
+_SHELL_META_RE = re.compile(r'[;|&`$<>]')
+_SHELL_CMD_RE = re.compile(r'\b(exec|system|popen|shell|bash|cmd)\b', re.I)
+_URL_RE = re.compile(r'(https?://[\w\-.:@/%&?=~+#]+)')
+_REMOTE_URL_RE = re.compile(r'http[s]?://')
+_WEBSHELL_CODE_RE = re.compile(r'\b(eval|exec|system|passthru|shell_exec|popen)\b', re.I)
+
 # Normalize helpers
 def norm(s):
     if not s:
@@ -26,9 +36,9 @@ def detect_sqli(params, raw):
 def detect_xss(params, raw):
     s = norm(raw)
     score = 0
-    if re.search(r"<[^>]+>", s):
+    if _HTML_TAG_RE.search(s):
         score += 40
-    if re.search(r'on\w+\s*=\s*"', s, re.I):
+    if _EVENT_HANDLER_RE.search(s):
         score += 20
     if '<script' in s.lower() or 'javascript:' in s.lower():
         score += 30
@@ -46,16 +56,16 @@ def detect_dir_traversal(params, raw):
 def detect_cmd_injection(params, raw):
     s = raw
     score = 0
-    if re.search(r'[;|&`$<>]', s):
+    if _SHELL_META_RE.search(s):
         score += 30
-    if re.search(r'\b(exec|system|popen|shell|bash|cmd)\b', s, re.I):
+    if _SHELL_CMD_RE.search(s):
         score += 30
     return (score>=40, min(95, score), 'Command Injection' if score>=40 else '')
 
 def detect_ssrf(params, raw):
     s = norm(raw)
     score = 0
-    urls = re.findall(r'(https?://[\w\-.:@/%&?=~+#]+)', s)
+    urls = _URL_RE.findall(s)
     for u in urls:
         p = urlparse(u)
         host = p.hostname
@@ -70,7 +80,7 @@ def detect_ssrf(params, raw):
 def detect_rfi_lfi(params, raw):
     s = raw.lower()
     score = 0
-    if re.search(r'http[s]?://', s):
+    if _REMOTE_URL_RE.search(s):
         score += 40
     if '../' in s or '%2e%2e' in s:
         score += 30
@@ -94,19 +104,25 @@ def detect_webshell(filename, body):
     for n in suspicious_names:
         if n in (filename or '').lower():
             return True, 90, 'Webshell filename'
-    if body and re.search(r'\b(eval|exec|system|passthru|shell_exec|popen)\b', body, re.I):
+    if body and _WEBSHELL_CODE_RE.search(body):
         return True, 85, 'Webshell-like code'
     return False, 0, ''
 
 def detect_credential_stuffing(recent_login_attempts):
-    from collections import Counter
-    ips = [ip for ip, succ in recent_login_attempts if not succ]
-    c = Counter(ips)
-    for ip, cnt in c.items():
-        if cnt >= 10:
+    # Single pass over failed attempts, stopping at the first IP over the threshold
+    failures = Counter()
+    for ip, succ in recent_login_attempts:
+        if succ:
+            continue
+        failures[ip] += 1
+        if failures[ip] >= 10:
             return True, 80, 'Credential stuffing / brute force'
     return False, 0, ''
 
+# (params, raw) detectors run by run_all, built once at import
+_PARAM_DETECTORS = (detect_sqli, detect_xss, detect_dir_traversal, detect_cmd_injection,
+                    detect_ssrf, detect_rfi_lfi)
+
 def run_all(record, recent_login_attempts=None):
     alerts = []
     raw = record.get('raw','')
@@ -114,9 +130,7 @@ def run_all(record, recent_login_attempts=None):
     body = record.get('body','')
     filename = record.get('filename','')
 
-    funcs = [detect_sqli, detect_xss, detect_dir_traversal, detect_cmd_injection,
-            detect_ssrf, detect_rfi_lfi]
-    for f in funcs:
+    for f in _PARAM_DETECTORS:
         try:
             hit, conf, note = f(params, raw)
             if hit:
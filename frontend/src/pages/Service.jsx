@@ -77,26 +77,44 @@ const Service = () => {
       warning("WebSocket Disconnected", "Reconnecting...");
     });
 
-    socketRef.current.on("new_alert", (alert) => {
-      success(
-        "New High-Confidence Alert",
-        `${alert.attack} from ${alert.src_ip} (${alert.confidence}% confidence)`
-      );
-
-      // Show browser notification
+    socketRef.current.on("new_alerts_batch", ({ alerts = [] } = {}) => {
+      if (alerts.length === 0) return;
+      const title =
+        alerts.length === 1
+          ? "New High-Confidence Alert"
+          : `${alerts.length} New High-Confidence Alerts`;
+      const summary = alerts
+        .slice(0, 3)
+        .map((a) => `${a.attack} from ${a.src_ip} (${a.confidence}% confidence)`)
+        .join("\n");
+      const body =
+        alerts.length > 3 ? `${summary}\n...and ${alerts.length - 3} more` : summary;
+
+      success(title, body);
+
+      // One browser notification per batch
       if (Notification.permission === "granted") {
-        new Notification("New High-Confidence Alert", {
-          body: `${alert.attack} from ${alert.src_ip} (${alert.confidence}% confidence)`,
+        new Notification(title, {
+          body,
           icon: "/Logo.png",
           badge: "/Logo.png",
         });
       }
 
-      // Reload alerts
+      // Reload alerts once for the whole batch
       loadAlerts();
       loadStats();
     });
 
+    socketRef.current.on("ips_blocked", (blocks) => {
+      if (!Array.isArray(blocks) || blocks.length === 0) return;
+      warning(
+        blocks.length === 1 ? "IP Auto-Blocked" : `${blocks.length} IPs Auto-Blocked`,
+        blocks.map((b) => b.ip).join(", ")
+      );
+      loadBlocklist();
+    });
+
     // Request notification permission
     if ("Notification" in window && Notification.permission === "default") {
       Notification.requestPermission().then((permission) => {
@@ -212,7 +230,7 @@ const Service = () => {
   const loadBlocklist = async () => {
     try {
       const response = await axios.get("/api/blocklist");
-      setBlocklist(response.data || []);
+      setBlocklist(response.data?.items || []);
     } catch (err) {
       console.error("Error loading blocklist:", err);
     }
@@ -221,7 +239,7 @@ const Service = () => {
   const loadWhitelist = async () => {
     try {
       const response = await axios.get("/api/whitelist");
-      setWhitelist(response.data || []);
+      setWhitelist(response.data?.items || []);
     } catch (err) {
       console.error("Error loading whitelist:", err);
     }
@@ -6,10 +6,13 @@ backlog = 2048
 
 # Worker processes
 workers = int(os.getenv('GUNICORN_WORKERS', 4))
-worker_class = 'eventlet'  # Required for SocketIO
-worker_connections = 1000
+worker_class = 'gevent'  # Green-thread worker for SocketIO (matches SOCKETIO_ASYNC_MODE=gevent)
+worker_connections = 2000  # Websockets are long-lived; each one holds a connection slot
 timeout = 30
 keepalive = 2
+# send_file responses (PCAP downloads) go out via wsgi.file_wrapper -> sendfile(2);
+# under gevent workers the transfer yields to other greenlets instead of pinning a worker
+sendfile = True
 
 # Logging
 accesslog = '-'  # Log to stdout
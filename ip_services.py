@@ -1,25 +1,267 @@
+import logging
 import requests
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from pymongo.write_concern import WriteConcern
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-from datetime import datetime, timedelta
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import ipaddress
 import os
+import re
+import socket
+from bisect import bisect_right
+
+from models_mongodb import utcnow
+
+logger = logging.getLogger(__name__)
+
+try:
+    import geoip2.database
+    import geoip2.errors
+except ImportError:  # Optional: local MaxMind lookups
+    geoip2 = None
+
+try:
+    import asyncio
+    import aiohttp
+except ImportError:  # Optional: concurrent bulk geolocation
+    aiohttp = None
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:  # Optional: gevent async mode (bulk fetches then use green threads)
+    gevent_monkey = None
+
+try:
+    import numpy as np
+except ImportError:  # Optional: vectorized CIDR membership
+    np = None
 
 # Cache duration (in days)
 GEO_CACHE_DAYS = 7
 REP_CACHE_DAYS = 1
 
+# In-process memo in front of the MongoDB caches (seconds / entries)
+IP_LOOKUP_MEMO_TTL = int(os.getenv("IP_LOOKUP_MEMO_TTL", "3600"))
+IP_LOOKUP_MEMO_SIZE = 50000
+# Fallback results (expired cache or local classification after an API failure) are retried sooner
+IP_LOOKUP_STALE_MEMO_TTL = int(os.getenv("IP_LOOKUP_STALE_MEMO_TTL", "60"))
+
+# Bulk geolocation: API calls per bulk lookup, concurrency, and request start rate (per second)
+GEO_API_URL = 'https://ipapi.co/{ip}/json/'
+GEO_BULK_FETCH_LIMIT = 10
+GEO_BULK_CONCURRENCY = 16
+GEO_API_RATE = float(os.getenv("GEO_API_RATE", "10"))
+
+# AbuseIPDB: base URL and API calls per bulk reputation lookup
+ABUSEIPDB_API_URL = 'https://api.abuseipdb.com/api/v2'
+REP_BULK_FETCH_LIMIT = 10
+
+# IPs per $in query when reading the caches in bulk
+IP_QUERY_CHUNK = 1000
+
+# Fields read back from the geolocation cache
+_GEO_CACHE_PROJECTION = {
+    "ip": 1, "country": 1, "city": 1, "latitude": 1, "longitude": 1,
+    "country_code": 1, "last_updated": 1, "_id": 0
+}
+
+# Fields read back from the reputation cache
+_REP_CACHE_PROJECTION = {"ip": 1, "abuse_score": 1, "is_public": 1, "usage_type": 1, "last_checked": 1, "_id": 0}
+
+# Most recent alerts returned per IP by get_ip_history / get_ip_history_bulk
+IP_HISTORY_LIMIT = 50
+
+# Only the fields a history entry shows
+_HISTORY_PROJECTION = {"timestamp": 1, "attack_type": 1, "confidence": 1, "url": 1, "status": 1}
+
+# alerts index (created at app startup as ip_time_compound) that serves history queries
+_HISTORY_INDEX = [("src_ip", 1), ("timestamp", -1)]
+
 
+def _build_http_session():
+    """Keep-alive session for the lookup APIs, so repeat lookups reuse TLS connections"""
+    session = requests.Session()
+    # 429 is not retried: the callers fall back to stale cache entries instead of waiting
+    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                    allowed_methods=['GET'], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retries)
+    session.mount('https://ipapi.co', adapter)
+    session.mount('https://api.abuseipdb.com', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip'})
+    return session
+
+
+http_session = _build_http_session()
+
+# Local MaxMind GeoLite2 database, opened once and shared by all lookups
+GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH", "GeoLite2-City.mmdb")
+
+
+def _open_geoip_reader():
+    """Open the local GeoLite2 database if geoip2 and the .mmdb file are available"""
+    if geoip2 is None or not os.path.exists(GEOIP_DB_PATH):
+        return None
+    try:
+        return geoip2.database.Reader(GEOIP_DB_PATH)
+    except Exception as e:
+        logger.warning("Cannot open GeoIP database %s: %s", GEOIP_DB_PATH, e)
+        return None
+
+
+geoip_reader = _open_geoip_reader()
+
+
+def ensure_ip_indexes(mongo_db):
+    """
+    Create the IP cache indexes (called at startup)
+    
+    Cache entries are looked up by IP and expire by TTL index after twice their freshness
+    window, so an expired entry can still serve as a fallback when the API is unavailable.
+    """
+    mongo_db.ip_geolocation.create_index("ip", unique=True, sparse=True, name="geo_ip")
+    _ensure_ttl_index(mongo_db, mongo_db.ip_geolocation, "last_updated", GEO_CACHE_DAYS * 2 * 86400, "geo_ttl")
+    mongo_db.ip_reputation.create_index("ip", unique=True, sparse=True, name="rep_ip")
+    _ensure_ttl_index(mongo_db, mongo_db.ip_reputation, "last_checked", REP_CACHE_DAYS * 2 * 86400, "rep_ttl")
+
+
+def _ensure_ttl_index(mongo_db, collection, field, seconds, name):
+    """
+    Create a TTL index, or retune an existing index on the same field in place
+    
+    create_index refuses to change expireAfterSeconds (or add it to a plain index),
+    so a changed cache window would otherwise leave the old expiry running.
+    """
+    try:
+        collection.create_index(field, expireAfterSeconds=seconds, name=name)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict, IndexKeySpecsConflict
+            raise
+        mongo_db.command('collMod', collection.name, index={'keyPattern': {field: 1}, 'expireAfterSeconds': seconds})
+
+
+class StaleResult(dict):
+    """Lookup result served as a fallback after an API failure (memoized only for stale_ttl)"""
+
+
+def memoize_by_ip(ttl=IP_LOOKUP_MEMO_TTL, maxsize=IP_LOOKUP_MEMO_SIZE, stale_ttl=IP_LOOKUP_STALE_MEMO_TTL):
+    """
+    Process-wide TTL memo for per-IP lookups, keyed by IP only
+    
+    Failed lookups (None) are not memoized and fallbacks (StaleResult) only for stale_ttl,
+    so rate limits and timeouts are retried. The oldest entry is evicted once maxsize is reached.
+    """
+    def decorator(func):
+        cache = {}
+        # Shared by request threads and the lookup pool
+        lock = threading.Lock()
+        
+        @functools.wraps(func)
+        def wrapper(ip, mongo_db=None):
+            now = time.monotonic()
+            with lock:
+                hit = cache.get(ip)
+            if hit and hit[0] > now:
+                return hit[1]
+            
+            result = func(ip, mongo_db)
+            if result is not None:
+                expires = now + (stale_ttl if isinstance(result, StaleResult) else ttl)
+                with lock:
+                    cache.pop(ip, None)
+                    if len(cache) >= maxsize:
+                        cache.pop(next(iter(cache)), None)
+                    cache[ip] = (expires, result)
+            return result
+        
+        def cache_clear():
+            with lock:
+                cache.clear()
+        
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+def _app_mongo_db(caller):
+    """MongoDB handle of the current Flask app, for callers that did not pass one (None outside an app context)"""
+    try:
+        # Access mongo.db directly (Flask-PyMongo pattern)
+        return current_app.mongo.db
+    except (RuntimeError, AttributeError) as e:
+        logger.warning("Cannot access MongoDB in %s: %s", caller, e)
+        return None
+
+
+@functools.lru_cache(maxsize=65536)
 def is_valid_ip(ip):
-    """Check if IP address is valid"""
-    if not ip or ip == '':
+    """Check if IP address is valid (memoized - the same source IPs repeat across alerts)"""
+    if not ip:
         return False
+    # inet_pton validates in C without building an ipaddress object
+    try:
+        socket.inet_pton(socket.AF_INET, ip)
+        return True
+    except (OSError, ValueError):
+        pass
     try:
-        ipaddress.ip_address(ip)
+        socket.inet_pton(socket.AF_INET6, ip)
         return True
-    except ValueError:
+    except (OSError, ValueError):
         return False
 
 
+def _local_geolocation(ip):
+    """Look up an IP in the local GeoLite2 database (None on miss or when unavailable)"""
+    if geoip_reader is None:
+        return None
+    try:
+        resp = geoip_reader.city(ip)
+    except (geoip2.errors.AddressNotFoundError, ValueError):
+        return None
+    return {
+        'country': resp.country.name or 'Unknown',
+        'city': resp.city.name or 'Unknown',
+        'latitude': resp.location.latitude,
+        'longitude': resp.location.longitude,
+        'country_code': resp.country.iso_code or ''
+    }
+
+
+def _geo_from_api(data):
+    """Geolocation dict from an ipapi.co JSON response"""
+    return {
+        'country': data.get('country_name', 'Unknown'),
+        'city': data.get('city', 'Unknown'),
+        'latitude': data.get('latitude'),
+        'longitude': data.get('longitude'),
+        'country_code': data.get('country_code', '')
+    }
+
+
+def _geo_from_cache(doc):
+    """Geolocation dict from an ip_geolocation cache document"""
+    return {
+        'country': doc.get('country', 'Unknown'),
+        'city': doc.get('city', 'Unknown'),
+        'latitude': doc.get('latitude'),
+        'longitude': doc.get('longitude'),
+        'country_code': doc.get('country_code', '')
+    }
+
+
+def _geo_cache_fresh(doc, now):
+    """Whether a cache document is younger than GEO_CACHE_DAYS"""
+    return (now - doc.get('last_updated', now)).days < GEO_CACHE_DAYS
+
+
+@memoize_by_ip()
 def get_ip_geolocation(ip, mongo_db=None):
     """
     Get geolocation for an IP address (with MongoDB caching)
@@ -34,51 +276,36 @@ def get_ip_geolocation(ip, mongo_db=None):
     if not is_valid_ip(ip):
         return None
     
+    # Local database lookup needs neither MongoDB nor the network
+    local = _local_geolocation(ip)
+    if local:
+        return local
+    
     # Use global mongo if not provided
     if mongo_db is None:
-        try:
-            from flask import current_app
-            # Access mongo.db directly (Flask-PyMongo pattern)
-            mongo_db = current_app.mongo.db
-        except (RuntimeError, AttributeError) as e:
-            import sys
-            sys.stderr.write(f"⚠ Cannot access MongoDB in get_ip_geolocation: {e}\n")
+        mongo_db = _app_mongo_db('get_ip_geolocation')
+        if mongo_db is None:
             return None
     
     try:
-        # Check cache first
-        cached = mongo_db.ip_geolocation.find_one({"ip": ip})
+        # Check cache first (expired entries are kept as a fallback if the API fails)
+        cached = mongo_db.ip_geolocation.find_one({"ip": ip}, _GEO_CACHE_PROJECTION)
         
-        if cached:
-            # Check if cache is still valid
-            cache_age = datetime.utcnow() - cached.get('last_updated', datetime.utcnow())
-            if cache_age.days < GEO_CACHE_DAYS:
-                return {
-                    'country': cached.get('country', 'Unknown'),
-                    'city': cached.get('city', 'Unknown'),
-                    'latitude': cached.get('latitude'),
-                    'longitude': cached.get('longitude'),
-                    'country_code': cached.get('country_code', '')
-                }
+        now = utcnow()
+        if cached and _geo_cache_fresh(cached, now):
+            return _geo_from_cache(cached)
         
         # Fetch from API (using free ipapi.co)
         try:
             # Free tier: 1000 requests/day
-            response = requests.get(
-                f'https://ipapi.co/{ip}/json/',
+            response = http_session.get(
+                GEO_API_URL.format(ip=ip),
                 timeout=5,
                 verify=True
             )
             
             if response.status_code == 200:
-                data = response.json()
-                geo_data = {
-                    'country': data.get('country_name', 'Unknown'),
-                    'city': data.get('city', 'Unknown'),
-                    'latitude': data.get('latitude'),
-                    'longitude': data.get('longitude'),
-                    'country_code': data.get('country_code', '')
-                }
+                geo_data = _geo_from_api(response.json())
                 
                 # Update or create cache in MongoDB
                 cache_doc = {
@@ -88,7 +315,7 @@ def get_ip_geolocation(ip, mongo_db=None):
                     'latitude': geo_data['latitude'],
                     'longitude': geo_data['longitude'],
                     'country_code': geo_data['country_code'],
-                    'last_updated': datetime.utcnow()
+                    'last_updated': now
                 }
                 
                 # Upsert (update if exists, insert if not)
@@ -102,53 +329,88 @@ def get_ip_geolocation(ip, mongo_db=None):
             
             elif response.status_code == 429:
                 # Rate limit exceeded - return cached data even if expired
-                import sys
-                sys.stderr.write(f"⚠ Geolocation API rate limit exceeded for {ip}\n")
+                logger.warning("Geolocation API rate limit exceeded for %s", ip)
                 if cached:
-                    return {
-                        'country': cached.get('country', 'Unknown'),
-                        'city': cached.get('city', 'Unknown'),
-                        'latitude': cached.get('latitude'),
-                        'longitude': cached.get('longitude'),
-                        'country_code': cached.get('country_code', '')
-                    }
+                    return StaleResult(_geo_from_cache(cached))
         
         except requests.exceptions.Timeout:
-            import sys
-            sys.stderr.write(f"⚠ Geolocation API timeout for {ip}\n")
+            logger.warning("Geolocation API timeout for %s", ip)
             # Return cached data even if expired
             if cached:
-                return {
-                    'country': cached.get('country', 'Unknown'),
-                    'city': cached.get('city', 'Unknown'),
-                    'latitude': cached.get('latitude'),
-                    'longitude': cached.get('longitude'),
-                    'country_code': cached.get('country_code', '')
-                }
+                return StaleResult(_geo_from_cache(cached))
         
         except Exception as e:
-            import sys
-            import traceback
-            sys.stderr.write(f"⚠ Geolocation API error for {ip}: {e}\n{traceback.format_exc()}\n")
+            logger.exception("Geolocation API error for %s: %s", ip, e)
             # Return cached data even if expired
             if cached:
-                return {
-                    'country': cached.get('country', 'Unknown'),
-                    'city': cached.get('city', 'Unknown'),
-                    'latitude': cached.get('latitude'),
-                    'longitude': cached.get('longitude'),
-                    'country_code': cached.get('country_code', '')
-                }
+                return StaleResult(_geo_from_cache(cached))
         
         return None
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ MongoDB geolocation cache error for {ip}: {e}\n{traceback.format_exc()}\n")
+        logger.exception("MongoDB geolocation cache error for %s: %s", ip, e)
         return None
 
 
+def _classify_ip(ip):
+    """(is_public, usage_type) of an IP from its address alone"""
+    try:
+        ip_obj = ipaddress.ip_address(ip)
+        # Check if it's a private/internal IP
+        is_public = ip_obj.is_global
+        
+        # Simple heuristic: known bad ranges or suspicious patterns
+        if not is_public:
+            return False, 'private'
+        if ip.startswith('192.168.') or ip.startswith('10.') or ip.startswith('172.'):
+            return False, 'private'
+        return True, 'public'
+    except Exception as e:
+        logger.exception("Reputation check error for %s: %s", ip, e)
+        return True, 'unknown'
+
+
+def _abuseipdb_check(ip, api_key):
+    """(abuse_score, usage_type) for one IP from AbuseIPDB /check (None on error)"""
+    try:
+        response = http_session.get(
+            ABUSEIPDB_API_URL + '/check',
+            params={'ipAddress': ip, 'maxAgeInDays': 90},
+            headers={'Key': api_key, 'Accept': 'application/json'},
+            timeout=5
+        )
+        if response.status_code == 200:
+            data = response.json().get('data', {})
+            return data.get('abuseConfidenceScore', 0), data.get('usageType', 'public')
+    except Exception as api_error:
+        logger.warning("AbuseIPDB API error for %s: %s", ip, api_error)
+    return None
+
+
+def _abuseipdb_check_block(network, api_key):
+    """
+    Abuse scores of the reported addresses in a network from AbuseIPDB /check-block
+    
+    Returns:
+        Dictionary mapping reported IPs to their score (unlisted IPs have no reports),
+        or None on error
+    """
+    try:
+        response = http_session.get(
+            ABUSEIPDB_API_URL + '/check-block',
+            params={'network': network, 'maxAgeInDays': 90},
+            headers={'Key': api_key, 'Accept': 'application/json'},
+            timeout=10
+        )
+        if response.status_code == 200:
+            reported = response.json().get('data', {}).get('reportedAddress', [])
+            return {entry['ipAddress']: entry.get('abuseConfidenceScore', 0) for entry in reported}
+    except Exception as api_error:
+        logger.warning("AbuseIPDB API error for %s: %s", network, api_error)
+    return None
+
+
+@memoize_by_ip()
 def get_ip_reputation(ip, mongo_db=None):
     """
     Get reputation for an IP address (with MongoDB caching)
@@ -165,22 +427,18 @@ def get_ip_reputation(ip, mongo_db=None):
     
     # Use global mongo if not provided
     if mongo_db is None:
-        try:
-            from flask import current_app
-            # Access mongo.db directly (Flask-PyMongo pattern)
-            mongo_db = current_app.mongo.db
-        except (RuntimeError, AttributeError) as e:
-            import sys
-            sys.stderr.write(f"⚠ Cannot access MongoDB in get_ip_reputation: {e}\n")
+        mongo_db = _app_mongo_db('get_ip_reputation')
+        if mongo_db is None:
             return None
     
     try:
         # Check cache first
-        cached = mongo_db.ip_reputation.find_one({"ip": ip})
+        cached = mongo_db.ip_reputation.find_one({"ip": ip}, _REP_CACHE_PROJECTION)
         
         if cached:
             # Check if cache is still valid
-            cache_age = datetime.utcnow() - cached.get('last_checked', datetime.utcnow())
+            now = utcnow()
+            cache_age = now - cached.get('last_checked', now)
             if cache_age.days < REP_CACHE_DAYS:
                 return {
                     'abuse_score': cached.get('abuse_score', 0),
@@ -190,47 +448,15 @@ def get_ip_reputation(ip, mongo_db=None):
         
         # Calculate reputation score
         abuse_score = 0
-        usage_type = 'unknown'
-        try:
-            ip_obj = ipaddress.ip_address(ip)
-            # Check if it's a private/internal IP
-            is_public = ip_obj.is_global
-            
-            # Simple heuristic: known bad ranges or suspicious patterns
-            if not is_public:
-                usage_type = 'private'
-            elif ip.startswith('192.168.') or ip.startswith('10.') or ip.startswith('172.'):
-                usage_type = 'private'
-                is_public = False
-            else:
-                usage_type = 'public'
-            
-            # Optional: Integrate with AbuseIPDB if you have an API key
-            abuseipdb_key = os.getenv('ABUSEIPDB_API_KEY')
-            if abuseipdb_key and is_public:
-                try:
-                    response = requests.get(
-                        'https://api.abuseipdb.com/api/v2/check',
-                        params={'ipAddress': ip, 'maxAgeInDays': 90},
-                        headers={'Key': abuseipdb_key, 'Accept': 'application/json'},
-                        timeout=5
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json().get('data', {})
-                        abuse_score = data.get('abuseConfidenceScore', 0)
-                        usage_type = data.get('usageType', 'public')
-                
-                except Exception as api_error:
-                    import sys
-                    sys.stderr.write(f"⚠ AbuseIPDB API error for {ip}: {api_error}\n")
+        is_public, usage_type = _classify_ip(ip)
         
-        except Exception as e:
-            import sys
-            import traceback
-            sys.stderr.write(f"⚠ Reputation check error for {ip}: {e}\n{traceback.format_exc()}\n")
-            is_public = True
-            usage_type = 'unknown'
+        # Optional: Integrate with AbuseIPDB if you have an API key
+        abuseipdb_key = os.getenv('ABUSEIPDB_API_KEY')
+        checked = None
+        if abuseipdb_key and is_public:
+            checked = _abuseipdb_check(ip, abuseipdb_key)
+            if checked:
+                abuse_score, usage_type = checked
         
         rep_data = {
             'abuse_score': abuse_score,
@@ -238,13 +464,17 @@ def get_ip_reputation(ip, mongo_db=None):
             'usage_type': usage_type
         }
         
+        if abuseipdb_key and is_public and not checked:
+            # API error: answer with the local classification, but neither cache it nor memoize it for long
+            return StaleResult(rep_data)
+        
         # Update or create cache in MongoDB
         cache_doc = {
             'ip': ip,
             'abuse_score': abuse_score,
             'is_public': is_public,
             'usage_type': usage_type,
-            'last_checked': datetime.utcnow()
+            'last_checked': utcnow()
         }
         
         # Upsert
@@ -257,12 +487,22 @@ def get_ip_reputation(ip, mongo_db=None):
         return rep_data
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ MongoDB reputation cache error for {ip}: {e}\n{traceback.format_exc()}\n")
+        logger.exception("MongoDB reputation cache error for %s: %s", ip, e)
         return None
 
 
+def _format_history_entry(alert):
+    """Shape an alert document as an IP history entry"""
+    return {
+        'id': str(alert['_id']),
+        'timestamp': alert['timestamp'].isoformat() if isinstance(alert['timestamp'], datetime) else str(alert['timestamp']),
+        'attack_type': alert.get('attack_type', 'Unknown'),
+        'confidence': alert.get('confidence', 0),
+        'url': alert.get('url', ''),
+        'status': alert.get('status', 'new')
+    }
+
+
 def get_ip_history(ip, mongo_db=None):
     """
     Get attack history for an IP from MongoDB alerts collection
@@ -279,41 +519,59 @@ def get_ip_history(ip, mongo_db=None):
     
     # Use global mongo if not provided
     if mongo_db is None:
-        try:
-            from flask import current_app
-            # Access mongo.db directly (Flask-PyMongo pattern)
-            mongo_db = current_app.mongo.db
-        except (RuntimeError, AttributeError) as e:
-            import sys
-            sys.stderr.write(f"⚠ Cannot access MongoDB in get_ip_history: {e}\n")
+        mongo_db = _app_mongo_db('get_ip_history')
+        if mongo_db is None:
             return []
     
     try:
-        # Query MongoDB alerts collection
-        alerts = list(mongo_db.alerts.find(
-            {"src_ip": ip}
-        ).sort("timestamp", -1).limit(50))
-        
-        history = []
-        for alert in alerts:
-            history.append({
-                'id': str(alert['_id']),
-                'timestamp': alert['timestamp'].isoformat() if isinstance(alert['timestamp'], datetime) else str(alert['timestamp']),
-                'attack_type': alert.get('attack_type', 'Unknown'),
-                'confidence': alert.get('confidence', 0),
-                'url': alert.get('url', ''),
-                'status': alert.get('status', 'new')
-            })
+        # Query MongoDB alerts collection; the (src_ip, timestamp) index returns rows
+        # already in order, so the limit stops the scan without an in-memory sort
+        alerts = mongo_db.alerts.find(
+            {"src_ip": ip}, _HISTORY_PROJECTION
+        ).sort("timestamp", -1).hint(_HISTORY_INDEX).limit(IP_HISTORY_LIMIT)
         
-        return history
+        return [_format_history_entry(alert) for alert in alerts]
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ Error fetching IP history for {ip}: {e}\n{traceback.format_exc()}\n")
+        logger.exception("Error fetching IP history for %s: %s", ip, e)
         return []
 
 
+def get_ip_history_bulk(ips, mongo_db, per_ip=IP_HISTORY_LIMIT):
+    """
+    Get attack history for many IPs with a single aggregation
+    
+    Args:
+        ips: Iterable of IP addresses
+        mongo_db: MongoDB database instance
+        per_ip: Most recent alerts kept per IP
+    
+    Returns:
+        Dictionary mapping each valid IP to its list of alert dictionaries
+        (empty list for IPs without alerts)
+    """
+    ips = list(dict.fromkeys(ip for ip in ips if isinstance(ip, str) and is_valid_ip(ip)))
+    history = {ip: [] for ip in ips}
+    if not ips:
+        return history
+    
+    pipeline = [
+        {"$match": {"src_ip": {"$in": ips}}},
+        {"$project": dict(_HISTORY_PROJECTION, src_ip=1)},
+        {"$sort": {"timestamp": -1}},
+        {"$group": {"_id": "$src_ip", "alerts": {"$push": "$$ROOT"}}},
+        {"$project": {"alerts": {"$slice": ["$alerts", per_ip]}}}
+    ]
+    
+    try:
+        for group in mongo_db.alerts.aggregate(pipeline, allowDiskUse=True):
+            history[group['_id']] = [_format_history_entry(alert) for alert in group['alerts']]
+    except Exception as e:
+        logger.exception("Error fetching bulk IP history: %s", e)
+    
+    return history
+
+
 def check_ip_in_cidr(ip, cidr):
     """
     Check if IP is in CIDR range
@@ -330,18 +588,285 @@ def check_ip_in_cidr(ip, cidr):
         network = ipaddress.ip_network(cidr, strict=False)
         return ip_obj in network
     except Exception as e:
-        import sys
-        sys.stderr.write(f"⚠ CIDR check error for {ip} in {cidr}: {e}\n")
+        logger.warning("CIDR check error for %s in %s: %s", ip, cidr, e)
         return False
 
 
-def bulk_geolocate_ips(ip_list, mongo_db=None):
+def cidr_to_regex(cidr):
+    """
+    Anchored regex matching exactly the dotted-quad IPv4 addresses in a CIDR range,
+    so the range can be filtered by MongoDB (as an index prefix scan) instead of in Python
+    
+    Args:
+        cidr: CIDR range (e.g., '192.168.1.0/24', '10.0.16.0/20')
+    
+    Returns:
+        Regex string, or None for IPv6 ranges
+    
+    Raises:
+        ValueError: If cidr is not a valid network
+    """
+    network = ipaddress.ip_network(cidr, strict=False)
+    if network.version != 4:
+        return None
+    
+    octets = str(network.network_address).split('.')
+    fixed, partial_bits = divmod(network.prefixlen, 8)
+    if fixed == 4:
+        return f"^{re.escape(str(network.network_address))}$"
+    
+    if not network.prefixlen:
+        # 0.0.0.0/0: any IPv4 address, but not IPv6 or other strings
+        return r"^\d+\.\d+\.\d+\.\d+$"
+    
+    prefix = re.escape('.'.join(octets[:fixed]) + '.') if fixed else ''
+    if not partial_bits:
+        return f"^{prefix}"
+    
+    # Prefix ends mid-octet: enumerate the values that octet can take
+    first = int(octets[fixed])
+    values = '|'.join(str(v) for v in range(first, first + 2 ** (8 - partial_bits)))
+    terminator = '$' if fixed == 3 else r'\.'
+    return f"^{prefix}(?:{values}){terminator}"
+
+
+def _ip_to_int(ip):
+    """
+    (version, integer value) of an IP address via inet_pton, or None if invalid
+    
+    Avoids building an ipaddress object for every lookup.
+    """
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except (OSError, TypeError, ValueError):
+        pass
+    try:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def build_cidr_index(cidrs, version=4):
+    """
+    Sorted interval endpoints for membership tests against many CIDR ranges
+    
+    Ranges are merged and stored half-open as [lo0, hi0 + 1, lo1, hi1 + 1, ...], so an
+    address is inside some range exactly when bisect_right/searchsorted lands on an odd index.
+    
+    Args:
+        cidrs: Iterable of CIDR ranges (invalid ones and other IP versions are skipped)
+        version: IP version of the index (4 or 6)
+    
+    Returns:
+        NumPy uint64 array for IPv4 when NumPy is available, otherwise a list of ints
+    """
+    intervals = []
+    for cidr in cidrs:
+        try:
+            network = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            continue
+        if network.version == version:
+            intervals.append((int(network.network_address), int(network.broadcast_address) + 1))
+    
+    endpoints = []
+    for lo, hi in sorted(intervals):
+        if endpoints and lo <= endpoints[-1]:
+            endpoints[-1] = max(endpoints[-1], hi)
+        else:
+            endpoints.extend((lo, hi))
+    
+    # IPv6 values exceed 64 bits, so only IPv4 indexes are vectorized
+    if np is not None and version == 4:
+        return np.array(endpoints, dtype=np.uint64)
+    return endpoints
+
+
+def ips_in_any_cidr(ips, index, version=4):
+    """
+    Check many IPs against a build_cidr_index() index at once
+    
+    Args:
+        ips: Sequence of IP address strings
+        index: Index from build_cidr_index (same version)
+        version: IP version of the index
+    
+    Returns:
+        List of booleans, one per IP (False for invalid IPs and other versions)
+    """
+    values = []
+    valid = []
+    for ip in ips:
+        parsed = _ip_to_int(ip)
+        ok = parsed is not None and parsed[0] == version
+        valid.append(ok)
+        values.append(parsed[1] if ok else 0)
+    
+    if np is not None and isinstance(index, np.ndarray):
+        positions = np.searchsorted(index, np.array(values, dtype=np.uint64), side='right')
+        hits = (positions & 1).astype(bool).tolist()
+    else:
+        hits = [bisect_right(index, value) & 1 == 1 for value in values]
+    return [ok and hit for ok, hit in zip(valid, hits)]
+
+
+class CidrSet:
+    """
+    Membership set of CIDR networks
+    
+    Networks are bucketed by (IP version, prefix length), so a lookup masks the
+    address once per distinct prefix length present (at most 33 for IPv4)
+    instead of scanning every network.
+    """
+    
+    def __init__(self, cidrs=()):
+        self._networks = {}  # (version, prefixlen) -> set of network addresses as ints
+        for cidr in cidrs:
+            self.add(cidr)
+    
+    def add(self, cidr):
+        """Add a CIDR range (invalid ranges are ignored)"""
+        try:
+            network = ipaddress.ip_network(cidr, strict=False)
+        except ValueError:
+            return
+        key = (network.version, network.prefixlen)
+        self._networks.setdefault(key, set()).add(int(network.network_address))
+    
+    def __contains__(self, ip):
+        parsed = _ip_to_int(ip)
+        if parsed is None:
+            return False
+        ip_version, value = parsed
+        max_prefixlen = 32 if ip_version == 4 else 128
+        for (version, prefixlen), networks in self._networks.items():
+            if version != ip_version:
+                continue
+            host_bits = max_prefixlen - prefixlen
+            if (value >> host_bits) << host_bits in networks:
+                return True
+        return False
+    
+    def __len__(self):
+        return sum(len(networks) for networks in self._networks.values())
+
+
+def _find_by_ips(collection, ips, projection):
+    """
+    Cache documents for a list of IPs, querying at most IP_QUERY_CHUNK IPs per $in
+    
+    Each chunk's cursor fetches its whole result in the first batch instead of
+    the default 101 documents plus getMore round trips.
+    """
+    for start in range(0, len(ips), IP_QUERY_CHUNK):
+        chunk = ips[start:start + IP_QUERY_CHUNK]
+        yield from collection.find({"ip": {"$in": chunk}}, projection).batch_size(len(chunk))
+
+
+def _flush_geo_cache(mongo_db, docs):
+    """
+    Upsert fetched geolocation cache documents in one unordered bulk write
+    
+    Cache entries can be refetched, so the write is acknowledged without waiting for the journal.
+    """
+    if not docs:
+        return
+    ops = [UpdateOne({"ip": doc['ip']}, {"$set": doc}, upsert=True) for doc in docs]
+    cache = mongo_db.ip_geolocation.with_options(write_concern=WriteConcern(w=1, j=False))
+    cache.bulk_write(ops, ordered=False)
+
+
+class _RateLimiter:
+    """Async token bucket spacing request starts at most `rate` per second"""
+    
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            wait = self.next_start - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_start = max(loop.time(), self.next_start) + self.interval
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def _fetch_geo(session, ip, semaphore, limiter):
+    """Fetch one IP from ipapi.co (None on error or rate limit)"""
+    async with semaphore:
+        async with limiter:
+            pass
+        try:
+            async with session.get(GEO_API_URL.format(ip=ip), timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 200:
+                    return ip, _geo_from_api(await response.json(content_type=None))
+                if response.status == 429:
+                    logger.warning("Geolocation API rate limit exceeded for %s", ip)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning("Geolocation API error for %s: %s", ip, e)
+    return ip, None
+
+
+async def _fetch_geo_all(ips):
+    """Fetch many IPs concurrently over one pooled connection set"""
+    connector = aiohttp.TCPConnector(limit=32, limit_per_host=8, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector, headers={'Accept-Encoding': 'gzip'}) as session:
+        semaphore = asyncio.Semaphore(GEO_BULK_CONCURRENCY)
+        limiter = _RateLimiter(GEO_API_RATE)
+        return dict(await asyncio.gather(*(_fetch_geo(session, ip, semaphore, limiter) for ip in ips)))
+
+
+def _green_threads():
+    """True when gevent has patched sockets (a nested asyncio loop would block the hub)"""
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('socket')
+
+
+def _fetch_geo_sync(ip, start_at):
+    """Fetch one IP from ipapi.co over the shared session, starting no earlier than start_at"""
+    wait = start_at - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+    try:
+        response = http_session.get(GEO_API_URL.format(ip=ip), timeout=5)
+        if response.status_code == 200:
+            return _geo_from_api(response.json())
+        if response.status_code == 429:
+            logger.warning("Geolocation API rate limit exceeded for %s", ip)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.warning("Geolocation API error for %s: %s", ip, e)
+    return None
+
+
+def _fetch_geo_pooled(ips, executor):
+    """Fetch many IPs on a thread pool (green threads under gevent), starts spaced at GEO_API_RATE"""
+    t0 = time.monotonic()
+    futures = {ip: executor.submit(_fetch_geo_sync, ip, t0 + i / GEO_API_RATE) for i, ip in enumerate(ips)}
+    fetched = {}
+    for ip, future in futures.items():
+        try:
+            fetched[ip] = future.result()
+        except Exception as e:
+            logger.warning("Geolocation API error for %s: %s", ip, e)
+    return fetched
+
+
+def bulk_geolocate_ips(ip_list, mongo_db=None, executor=None):
     """
     Bulk geolocation lookup with caching optimization
     
+    Uncached IPs are fetched concurrently: with aiohttp on its own event loop in threaded
+    mode, or on `executor` over the shared session when gevent is active (or aiohttp is
+    not installed).
+    
     Args:
         ip_list: List of IP addresses
         mongo_db: MongoDB database instance (optional)
+        executor: Thread pool for the session-based fetches (optional, one is created per call)
     
     Returns:
         Dictionary mapping IPs to geolocation data
@@ -351,104 +876,168 @@ def bulk_geolocate_ips(ip_list, mongo_db=None):
     
     # Use global mongo if not provided
     if mongo_db is None:
-        try:
-            from flask import current_app
-            # Access mongo.db directly (Flask-PyMongo pattern)
-            mongo_db = current_app.mongo.db
-        except (RuntimeError, AttributeError) as e:
-            import sys
-            sys.stderr.write(f"⚠ Cannot access MongoDB in bulk_geolocate_ips: {e}\n")
+        mongo_db = _app_mongo_db('bulk_geolocate_ips')
+        if mongo_db is None:
             return {}
     
     results = {}
     
-    # Filter valid IPs
-    valid_ips = [ip for ip in ip_list if is_valid_ip(ip)]
+    # Filter valid IPs; one attacker shows up in many alerts, so each IP is looked up once
+    valid_ips = list(dict.fromkeys(ip for ip in ip_list if is_valid_ip(ip)))
     if not valid_ips:
         return {}
     
+    # Resolve from the local database first; only misses go to cache/API
+    if geoip_reader is not None:
+        remaining = []
+        for ip in valid_ips:
+            local = _local_geolocation(ip)
+            if local:
+                results[ip] = local
+            else:
+                remaining.append(ip)
+        valid_ips = remaining
+        if not valid_ips:
+            return results
+    
     try:
-        # Bulk fetch from cache
-        cached_docs = mongo_db.ip_geolocation.find({"ip": {"$in": valid_ips}})
-        cached_map = {doc['ip']: doc for doc in cached_docs}
-        
-        # Identify IPs that need fresh lookup
-        uncached_ips = [ip for ip in valid_ips if ip not in cached_map]
-        
-        # Return cached results
-        for ip, doc in cached_map.items():
-            cache_age = datetime.utcnow() - doc.get('last_updated', datetime.utcnow())
-            if cache_age.days < GEO_CACHE_DAYS:
-                results[ip] = {
-                    'country': doc.get('country', 'Unknown'),
-                    'city': doc.get('city', 'Unknown'),
-                    'latitude': doc.get('latitude'),
-                    'longitude': doc.get('longitude'),
-                    'country_code': doc.get('country_code', '')
-                }
+        # Bulk fetch from cache, split into fresh results and stale fallbacks in one pass
+        now = utcnow()
+        stale_map = {}
+        for doc in _find_by_ips(mongo_db.ip_geolocation, valid_ips, _GEO_CACHE_PROJECTION):
+            if _geo_cache_fresh(doc, now):
+                results[doc['ip']] = _geo_from_cache(doc)
             else:
-                uncached_ips.append(ip)
+                stale_map[doc['ip']] = doc
+        
+        # Missing and expired IPs need a fresh lookup
+        uncached_ips = [ip for ip in valid_ips if ip not in results]
         
         # Fetch uncached IPs (rate limit aware)
-        for ip in uncached_ips[:10]:  # Limit to 10 per bulk request
-            geo = get_ip_geolocation(ip, mongo_db)
-            if geo:
-                results[ip] = geo
-            time.sleep(0.1)  # Rate limit protection
+        to_fetch = uncached_ips[:GEO_BULK_FETCH_LIMIT]
+        if to_fetch:
+            if aiohttp is not None and not _green_threads():
+                fetched = asyncio.run(_fetch_geo_all(to_fetch))
+            elif executor is not None:
+                fetched = _fetch_geo_pooled(to_fetch, executor)
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(to_fetch), GEO_BULK_CONCURRENCY)) as pool:
+                    fetched = _fetch_geo_pooled(to_fetch, pool)
+            
+            # Failures fall back to the expired cache entry if there is one
+            fresh_docs = []
+            fetched_at = utcnow()
+            for ip in to_fetch:
+                geo = fetched.get(ip)
+                if geo:
+                    results[ip] = geo
+                    fresh_docs.append(dict(geo, ip=ip, last_updated=fetched_at))
+                elif ip in stale_map:
+                    results[ip] = _geo_from_cache(stale_map[ip])
+            _flush_geo_cache(mongo_db, fresh_docs)
         
         return results
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ Bulk geolocation error: {e}\n{traceback.format_exc()}\n")
+        logger.exception("Bulk geolocation error: %s", e)
         return {}
 
 
-def clear_expired_cache(mongo_db=None):
+def bulk_get_ip_reputation(ip_list, mongo_db=None):
     """
-    Clean up expired cache entries from MongoDB
+    Bulk reputation lookup with caching, querying AbuseIPDB once per /24 block
+    
+    Uncached public IPv4 addresses that share a /24 are checked with a single
+    /check-block call; lone addresses and IPv6 use the per-IP /check endpoint.
     
     Args:
+        ip_list: List of IP addresses
         mongo_db: MongoDB database instance (optional)
     
     Returns:
-        Number of deleted entries
+        Dictionary mapping IPs to reputation data
     """
+    if not ip_list:
+        return {}
+    
+    # Use global mongo if not provided
     if mongo_db is None:
-        try:
-            from flask import current_app
-            # Access mongo.db directly (Flask-PyMongo pattern)
-            mongo_db = current_app.mongo.db
-        except (RuntimeError, AttributeError) as e:
-            import sys
-            sys.stderr.write(f"⚠ Cannot access MongoDB in clear_expired_cache: {e}\n")
-            return 0
+        mongo_db = _app_mongo_db('bulk_get_ip_reputation')
+        if mongo_db is None:
+            return {}
+    
+    valid_ips = list(dict.fromkeys(ip for ip in ip_list if is_valid_ip(ip)))
+    if not valid_ips:
+        return {}
     
+    results = {}
     try:
-        # Calculate cutoff dates
-        geo_cutoff = datetime.utcnow() - timedelta(days=GEO_CACHE_DAYS * 2)
-        rep_cutoff = datetime.utcnow() - timedelta(days=REP_CACHE_DAYS * 2)
+        now = utcnow()
+        for doc in _find_by_ips(mongo_db.ip_reputation, valid_ips, _REP_CACHE_PROJECTION):
+            if (now - doc.get('last_checked', now)).days < REP_CACHE_DAYS:
+                results[doc['ip']] = {
+                    'abuse_score': doc.get('abuse_score', 0),
+                    'is_public': doc.get('is_public', True),
+                    'usage_type': doc.get('usage_type', 'unknown')
+                }
         
-        # Delete expired geolocation cache
-        geo_result = mongo_db.ip_geolocation.delete_many({
-            "last_updated": {"$lt": geo_cutoff}
-        })
+        # Classify the rest locally; only public IPs go to AbuseIPDB
+        abuseipdb_key = os.getenv('ABUSEIPDB_API_KEY')
+        fresh = {}
+        failed = set()  # API errors: returned with the local classification, not cached
+        blocks = {}
+        singles = []
+        for ip in valid_ips:
+            if ip in results:
+                continue
+            is_public, usage_type = _classify_ip(ip)
+            fresh[ip] = {'abuse_score': 0, 'is_public': is_public, 'usage_type': usage_type}
+            if abuseipdb_key and is_public:
+                if ':' not in ip:
+                    blocks.setdefault(ip.rsplit('.', 1)[0] + '.0/24', []).append(ip)
+                else:
+                    singles.append(ip)
         
-        # Delete expired reputation cache
-        rep_result = mongo_db.ip_reputation.delete_many({
-            "last_checked": {"$lt": rep_cutoff}
-        })
+        # One call per shared /24, within the per-lookup API budget
+        calls = 0
+        for network, ips in blocks.items():
+            if len(ips) == 1:
+                singles.extend(ips)
+                continue
+            if calls >= REP_BULK_FETCH_LIMIT:
+                for ip in ips:
+                    fresh.pop(ip)
+                continue
+            calls += 1
+            scores = _abuseipdb_check_block(network, abuseipdb_key)
+            if scores is None:
+                failed.update(ips)
+                continue
+            for ip in ips:
+                fresh[ip]['abuse_score'] = scores.get(ip, 0)
         
-        total_deleted = geo_result.deleted_count + rep_result.deleted_count
+        for ip in singles:
+            if calls >= REP_BULK_FETCH_LIMIT:
+                fresh.pop(ip)
+                continue
+            calls += 1
+            checked = _abuseipdb_check(ip, abuseipdb_key)
+            if checked is None:
+                failed.add(ip)
+                continue
+            fresh[ip]['abuse_score'], fresh[ip]['usage_type'] = checked
         
-        if total_deleted > 0:
-            print(f"✓ Cleared {total_deleted} expired cache entries")
+        results.update(fresh)
+        checked_at = utcnow()
+        ops = [
+            UpdateOne({"ip": ip}, {"$set": dict(rep, ip=ip, last_checked=checked_at)}, upsert=True)
+            for ip, rep in fresh.items() if ip not in failed
+        ]
+        if ops:
+            mongo_db.ip_reputation.bulk_write(ops, ordered=False)
         
-        return total_deleted
+        return results
     
     except Exception as e:
-        import sys
-        import traceback
-        sys.stderr.write(f"⚠ Cache cleanup error: {e}\n{traceback.format_exc()}\n")
-        return 0
+        logger.exception("Bulk reputation error: %s", e)
+        return results
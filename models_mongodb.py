@@ -2,18 +2,30 @@
 MongoDB Document Models for Rakshak.ai
 """
 
-from datetime import datetime
+from datetime import datetime, timezone
 from bson import ObjectId
 
 
+def utcnow():
+    """
+    Current UTC time as a naive datetime
+
+    Naive to match what PyMongo returns for stored dates (tz_aware=False), so values
+    read back and values created here can be compared directly.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class AlertDocument:
     """Alert document structure and helper methods"""
 
     @staticmethod
     def create(attack_type, url, src_ip, confidence, raw,
                dst_ip="", http_method="", params="", user_agent="",
-               timestamp=None, status="new", priority=None, notes=""):
+               timestamp=None, status="new", priority=None, notes="",
+               geolocation=None, now=None):
         """Create a new alert document"""
+        now = now or utcnow()
 
         # Auto-assign priority based on confidence
         if priority is None:
@@ -36,12 +48,13 @@ class AlertDocument:
             "user_agent": user_agent,
             "confidence": confidence,
             "raw": raw,
-            "timestamp": timestamp or datetime.utcnow(),
+            "timestamp": timestamp or now,
             "status": status,
             "priority": priority,
             "notes": notes,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "geolocation": geolocation,
+            "created_at": now,
+            "updated_at": now
         }
 
     @staticmethod
@@ -66,7 +79,7 @@ class IPGeolocationDocument:
     """IP geolocation cache document"""
     
     @staticmethod
-    def create(ip, country, city, latitude=None, longitude=None, country_code=''):
+    def create(ip, country, city, latitude=None, longitude=None, country_code='', now=None):
         return {
             "ip": ip,
             "country": country,
@@ -74,7 +87,7 @@ class IPGeolocationDocument:
             "latitude": latitude,
             "longitude": longitude,
             "country_code": country_code,
-            "last_updated": datetime.utcnow()
+            "last_updated": now or utcnow()
         }
 
 
@@ -82,13 +95,13 @@ class IPReputationDocument:
     """IP reputation cache document"""
     
     @staticmethod
-    def create(ip, abuse_score=0, is_public=True, usage_type="unknown"):
+    def create(ip, abuse_score=0, is_public=True, usage_type="unknown", now=None):
         return {
             "ip": ip,
             "abuse_score": abuse_score,
             "is_public": is_public,
             "usage_type": usage_type,
-            "last_checked": datetime.utcnow()
+            "last_checked": now or utcnow()
         }
 
 
@@ -96,14 +109,14 @@ class BlocklistDocument:
     """Blocked IP document"""
 
     @staticmethod
-    def create(ip, reason="Manual block", auto_blocked=False, attack_count=0):
+    def create(ip, reason="Manual block", auto_blocked=False, attack_count=0, now=None):
         return {
             "ip": ip,
             "reason": reason,
             "auto_blocked": auto_blocked,
             "attack_count": attack_count,
             "is_active": True,
-            "created_at": datetime.utcnow()
+            "created_at": now or utcnow()
         }
 
     @staticmethod
@@ -124,12 +137,12 @@ class WhitelistDocument:
     """Whitelisted IP document"""
 
     @staticmethod
-    def create(ip, reason="Trusted IP"):
+    def create(ip, reason="Trusted IP", now=None):
         return {
             "ip": ip,
             "reason": reason,
             "is_active": True,
-            "created_at": datetime.utcnow()
+            "created_at": now or utcnow()
         }
 
     @staticmethod
@@ -151,11 +164,12 @@ class PcapCaptureDocument:
 
     @staticmethod
     def create(capture_id, interface, filter_rules="", max_packets=None, 
-               duration=None, filename="", created_by="system"):
+               duration=None, filename="", created_by="system", now=None):
         """Create a new PCAP capture document"""
+        now = now or utcnow()
         return {
             "capture_id": capture_id,
-            "start_time": datetime.utcnow(),
+            "start_time": now,
             "end_time": None,
             "status": "running",
             "interface": interface,
@@ -168,8 +182,8 @@ class PcapCaptureDocument:
             "process_id": None,
             "created_by": created_by,
             "metadata": {},
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
 
     @staticmethod
@@ -195,8 +209,9 @@ class GeminiThreatIntelDocument:
     @staticmethod
     def create(analysis_id, alert_id=None, ip_address=None, threat_level="medium",
                threat_type="", confidence_score=0.0, gemini_response=None,
-               recommendations=None):
+               recommendations=None, now=None):
         """Create a new Gemini threat intelligence document"""
+        now = now or utcnow()
         return {
             "analysis_id": analysis_id,
             "alert_id": alert_id,
@@ -204,11 +219,11 @@ class GeminiThreatIntelDocument:
             "threat_level": threat_level,
             "threat_type": threat_type,
             "confidence_score": confidence_score,
-            "analysis_timestamp": datetime.utcnow(),
+            "analysis_timestamp": now,
             "gemini_response": gemini_response or {},
             "recommendations": recommendations or [],
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
 
     @staticmethod
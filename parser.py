@@ -1,12 +1,242 @@
-import pyshark
 import re
 import os
+import mmap
+import socket
 from urllib.parse import urlparse, parse_qs
 
-def parse_pcap(pcap_path):
-    records = []
+try:
+    import dpkt
+except ImportError:  # Optional: in-process PCAP parsing
+    dpkt = None
+
+try:
+    import pyshark
+except ImportError:  # Optional: tshark-based PCAP parsing (fallback)
+    pyshark = None
+
+try:
+    import hyperscan
+except ImportError:  # Optional: SIMD access-log scanning
+    hyperscan = None
+
+# Apache/Nginx combined log format, matched over the raw file bytes: anchored per line,
+# and no group may cross a newline (comment lines cannot start a match)
+_ACCESS_LOG_RE = re.compile(
+    rb'^[ \t]*(?P<ip>[^#\s]\S*) \S+ \S+ \[(?P<time>[^\]\n]+)\] "(?P<method>\S+) (?P<path>\S+) HTTP/[^"\n]+" '
+    rb'(?P<status>\d+) (?P<size>\S+) "(?P<ref>[^"\n]*)" "(?P<ua>[^"\n]*)"',
+    re.MULTILINE
+)
+
+# Hyperscan reports match spans only, so it gets the same pattern without group names
+_ACCESS_LOG_HS_CHUNK = 8 * 1024 * 1024  # bytes per block scan, cut at a line break
+_access_log_hs_db = None
+if hyperscan is not None:
+    try:
+        _access_log_hs_db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        _access_log_hs_db.compile(
+            expressions=[re.sub(rb'\?P<\w+>', b'', _ACCESS_LOG_RE.pattern)],
+            ids=[0],
+            flags=[hyperscan.HS_FLAG_SOM_LEFTMOST | hyperscan.HS_FLAG_MULTILINE]
+        )
+    except Exception as e:
+        import sys
+        sys.stderr.write(f"⚠ Hyperscan access-log database unavailable, using re: {e}\n")
+        _access_log_hs_db = None
+
+# Request-line methods; payloads starting with anything else are not parsed as HTTP
+_HTTP_METHODS = frozenset((b'GET', b'POST', b'PUT', b'DELETE', b'HEAD', b'OPTIONS', b'PATCH', b'TRACE', b'CONNECT'))
+
+def _dpkt_reader(f):
+    """dpkt reader for a pcap or pcapng file, plus a decoder from link-layer frame to IP packet"""
+    try:
+        reader = dpkt.pcap.Reader(f)
+    except ValueError:
+        f.seek(0)
+        reader = dpkt.pcapng.Reader(f)
+
+    link = reader.datalink()
+    if link == dpkt.pcap.DLT_EN10MB:
+        return reader, lambda buf: dpkt.ethernet.Ethernet(buf).data
+    if link == dpkt.pcap.DLT_LINUX_SLL:
+        return reader, lambda buf: dpkt.sll.SLL(buf).data
+    if link in (dpkt.pcap.DLT_NULL, dpkt.pcap.DLT_LOOP):
+        return reader, lambda buf: dpkt.loopback.Loopback(buf).data
+    if link in (dpkt.pcap.DLT_RAW, 101):  # 101 = LINKTYPE_RAW
+        return reader, lambda buf: dpkt.ip6.IP6(buf) if buf[:1] and buf[0] >> 4 == 6 else dpkt.ip.IP(buf)
+    raise ValueError(f'unsupported link type {link}')
+
+def _header(headers, name):
+    """Single header value from dpkt's lower-cased header dict (repeated headers come as lists)"""
+    value = headers.get(name, '')
+    return value[0] if isinstance(value, list) else value
+
+def _http_record(family, ip, method, uri, headers, body):
+    """Request record (same shape as the pyshark path) from parsed HTTP fields"""
+    host = _header(headers, 'host')
+    full = f'http://{host}{uri}' if host else uri
+    params = {}
+    if '?' in uri:
+        path, q = uri.split('?',1)
+        params = parse_qs(q, keep_blank_values=True)
+    body = body.decode('utf-8', 'ignore') if body else ''
+    return {'src_ip': socket.inet_ntop(family, ip.src),
+            'dst_ip': socket.inet_ntop(family, ip.dst),
+            'method': method,
+            'url': full,
+            'params': params,
+            'user_agent': _header(headers, 'user-agent'),
+            'body': body,
+            'raw': full + ' ' + str(params) + ' ' + body}
+
+def _partial_request(data):
+    """(method, uri, headers, body) of a request whose body (or headers) never completed"""
+    head, _, body = bytes(data).partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) < 2:
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers.setdefault(name.strip().lower(), value.strip())
+    return parts[0], parts[1], headers, body
+
+def _request_fields(data):
+    """(method, uri, headers, body) of a complete request; NeedData while more segments are due"""
+    req = dpkt.http.Request(bytes(data))
+    return req.method, req.uri, req.headers, req.body
+
+def _pcap_frames(reader, pcap_path):
+    """(ts, buf) frames; a truncated final record (capture killed mid-write) ends the stream"""
+    frames = iter(reader)
+    while True:
+        try:
+            yield next(frames)
+        except StopIteration:
+            return
+        except (dpkt.UnpackError, ValueError) as e:
+            import sys
+            sys.stderr.write(f'Truncated capture {pcap_path}, stopping early: {e!r}\n')
+            return
+
+# Request bytes buffered per TCP flow while waiting for the rest of a multi-segment request
+PCAP_MAX_REQUEST_BYTES = 4 * 1024 * 1024
+
+def _iter_pcap_dpkt(reader, decode, pcap_path=''):
+    """
+    Yield HTTP request records parsed in-process by dpkt
+    
+    Requests spanning several TCP segments (POST bodies, uploads) are reassembled per flow
+    from in-order segments. A request that never completes (connection closed, segment
+    lost, capture ended or PCAP_MAX_REQUEST_BYTES reached) is still emitted with its
+    request line, headers and the body received so far.
+    """
+    # (src, sport, dst, dport) -> [family, ip, next_seq, bytearray]
+    pending = {}
+
+    def flush(flow):
+        family, ip, _, data = pending.pop(flow)
+        fields = _partial_request(data)
+        return _http_record(family, ip, *fields) if fields else None
+
+    for ts, buf in _pcap_frames(reader, pcap_path):
+        try:
+            ip = decode(buf)
+            if isinstance(ip, dpkt.ip.IP):
+                family = socket.AF_INET
+            elif isinstance(ip, dpkt.ip6.IP6):
+                family = socket.AF_INET6
+            else:
+                continue
+            tcp = ip.data
+            if not isinstance(tcp, dpkt.tcp.TCP):
+                continue
+        except (dpkt.UnpackError, ValueError, IndexError):
+            # Truncated or malformed frames are skipped
+            continue
+
+        flow = (ip.src, tcp.sport, ip.dst, tcp.dport)
+        payload = tcp.data
+        entry = pending.get(flow)
+        starts_request = payload[:8].split(b' ', 1)[0] in _HTTP_METHODS
+
+        if entry is not None:
+            if payload and tcp.seq == entry[2]:
+                # Next in-order segment of the buffered request
+                entry[3] += payload
+                entry[2] = (entry[2] + len(payload)) & 0xFFFFFFFF
+                try:
+                    fields = _request_fields(entry[3])
+                except dpkt.NeedData:
+                    fields = None
+                except (dpkt.UnpackError, ValueError):
+                    fields = False
+                if fields:
+                    del pending[flow]
+                    yield _http_record(family, ip, *fields)
+                elif (fields is False or len(entry[3]) >= PCAP_MAX_REQUEST_BYTES
+                      or tcp.flags & (dpkt.tcp.TH_FIN | dpkt.tcp.TH_RST)):
+                    record = flush(flow)
+                    if record:
+                        yield record
+                continue
+            if payload and 0 < ((entry[2] - tcp.seq) & 0xFFFFFFFF) < 0x80000000:
+                # Retransmission of data already buffered
+                continue
+            if starts_request or tcp.flags & (dpkt.tcp.TH_FIN | dpkt.tcp.TH_RST):
+                # A new request or the end of the connection: the buffered one is as complete as it gets
+                record = flush(flow)
+                if record:
+                    yield record
+            # Out-of-order segments past a gap are ignored
+
+        if not starts_request:
+            continue
+        try:
+            fields = _request_fields(payload)
+        except dpkt.NeedData:
+            # Body (or headers) continue in later segments
+            pending[flow] = [family, ip, (tcp.seq + len(payload)) & 0xFFFFFFFF, bytearray(payload)]
+            continue
+        except (dpkt.UnpackError, ValueError):
+            continue
+        yield _http_record(family, ip, *fields)
+
+    # Capture ended mid-request
+    for flow in list(pending):
+        record = flush(flow)
+        if record:
+            yield record
+
+def iter_pcap(pcap_path):
+    """Yield HTTP request records from a PCAP one packet at a time"""
+    if dpkt is not None:
+        f = open(pcap_path, 'rb')
+        try:
+            reader, decode = _dpkt_reader(f)
+        except (ValueError, dpkt.UnpackError) as e:
+            # Formats/link types dpkt cannot read go through tshark instead
+            f.close()
+            import sys
+            sys.stderr.write(f'dpkt cannot read {pcap_path} ({e}), falling back to pyshark\n')
+        else:
+            with f:
+                yield from _iter_pcap_dpkt(reader, decode, pcap_path)
+            return
+
+    if pyshark is None:
+        import sys
+        sys.stderr.write(f'Cannot parse {pcap_path}: pyshark is not installed\n')
+        return
+    try:
+        # keep_packets=False: pyshark would otherwise retain every parsed packet
+        cap = pyshark.FileCapture(pcap_path, display_filter='http.request', keep_packets=False)
+    except Exception as e:
+        import sys
+        sys.stderr.write(f'pyshark parse error: {e}\n')
+        return
     try:
-        cap = pyshark.FileCapture(pcap_path, display_filter='http.request')
         for pkt in cap:
             try:
                 http = pkt.http
@@ -32,62 +262,120 @@ def parse_pcap(pcap_path):
                        'user_agent': user_agent,
                        'body': body,
                        'raw': full + ' ' + str(params) + ' ' + (body or '')}
-                records.append(rec)
             except Exception:
                 continue
-        cap.close()
+            yield rec
     except Exception as e:
         import sys
         sys.stderr.write(f'pyshark parse error: {e}\n')
-    return records
+    finally:
+        cap.close()
 
-def parse_access_log(log_path):
-    """Parse Apache/Nginx access log file"""
+def parse_pcap(pcap_path):
+    """Parse HTTP requests from a PCAP into a list of records"""
+    return list(iter_pcap(pcap_path))
+
+def iter_access_log(log_path):
+    """Iterate records from an Apache/Nginx access log without loading it into memory"""
+    # Checked eagerly so a missing file fails before iteration starts
     if not os.path.exists(log_path):
         raise FileNotFoundError(f"Log file not found: {log_path}")
-    
-    pattern = re.compile(r'(?P<ip>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>\S+) (?P<path>\S+) HTTP/[^"]+" (?P<status>\d+) (?P<size>\S+) "(?P<ref>[^"]*)" "(?P<ua>[^"]*)"')
-    records = []
-    line_count = 0
+    return _access_log_records(log_path)
+
+def _regex_matches(mm):
+    """(start, end, ip, method, path, ua) for each log line matched by re"""
+    for m in _ACCESS_LOG_RE.finditer(mm):
+        yield m.start(), m.end(), m.group('ip'), m.group('method'), m.group('path'), m.group('ua')
+
+def _split_access_log_line(line):
+    """ip, method, path, ua of a matched combined-log line, by slicing on its delimiters"""
+    line = line.lstrip(b' \t')
+    ip = line[:line.index(b' ')]
+    # The request follows the first '] "' (time cannot contain ']')
+    req = line.index(b'] "') + 3
+    method_end = line.index(b' ', req)
+    path_end = line.index(b' ', method_end + 1)
+    # The match ends on the closing quote of the user agent
+    ua_start = line.rindex(b'"', 0, len(line) - 1) + 1
+    return ip, line[req:method_end], line[method_end + 1:path_end], line[ua_start:-1]
+
+def _hyperscan_matches(mm):
+    """(start, end, ip, method, path, ua) for each log line matched by hyperscan"""
+    size = len(mm)
+    pos = 0
+    while pos < size:
+        # Scan whole lines only, so no match straddles two blocks
+        limit = pos + _ACCESS_LOG_HS_CHUNK
+        if limit >= size:
+            end = size
+        else:
+            end = mm.rfind(b'\n', pos, limit) + 1 or mm.find(b'\n', limit) + 1 or size
+        block = mm[pos:end]
+        spans = []
+
+        def on_match(match_id, start, stop, flags, context):
+            # One report per line; drop repeats of the same start offset
+            if not spans or spans[-1][0] != start:
+                spans.append((start, stop))
+
+        _access_log_hs_db.scan(block, match_event_handler=on_match)
+        for start, stop in spans:
+            yield (pos + start, pos + stop) + _split_access_log_line(block[start:stop])
+        pos = end
+
+def _unmatched_lines(gap):
+    """Non-blank, non-comment lines in the bytes between two matches"""
+    for line in gap.splitlines():
+        line = line.strip()
+        if line and not line.startswith(b'#'):
+            yield line
+
+def _access_log_records(log_path):
     matched_count = 0
+    unmatched_count = 0
     
     try:
-        with open(log_path, 'r', errors='ignore', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                line_count += 1
-                m = pattern.match(line)
-                if not m:
-                    # Try to log first few unmatched lines for debugging (to stderr for WSGI safety)
-                    if line_count <= 5:
-                        import sys
-                        sys.stderr.write(f"Warning: Line {line_num} doesn't match pattern: {line[:100]}\n")
-                    continue
+        if os.path.getsize(log_path) == 0:
+            return
+        # The matcher walks the mapped file directly; no per-line str objects
+        with open(log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            matches = _hyperscan_matches(mm) if _access_log_hs_db is not None else _regex_matches(mm)
+            prev_end = 0
+            for start, end, ip, method, raw_path, ua in matches:
+                # Only gaps longer than the line break can hide unmatched lines
+                if unmatched_count < 5 and start - prev_end > 2:
+                    for line in _unmatched_lines(mm[prev_end:start]):
+                        unmatched_count += 1
+                        if unmatched_count <= 5:
+                            # Log first few unmatched lines for debugging (to stderr for WSGI safety)
+                            import sys
+                            sys.stderr.write(f"Warning: Line doesn't match pattern: {line[:100].decode('utf-8', 'ignore')}\n")
+                prev_end = end
                 
                 matched_count += 1
                 try:
-                    ip = m.group('ip')
-                    method = m.group('method')
-                    path = m.group('path')
-                    ua = m.group('ua')
+                    ip = ip.decode('ascii', 'ignore')
+                    method = method.decode('ascii', 'ignore')
+                    ua = ua.decode('utf-8', 'ignore')
+                    path = raw_path.decode('utf-8', 'ignore')
                     params = {}
-                    if '?' in path:
-                        p, q = path.split('?',1)
-                        params = parse_qs(q, keep_blank_values=True)
+                    q = raw_path.find(b'?')
+                    if q != -1:
+                        params = parse_qs(raw_path[q + 1:].decode('utf-8', 'ignore'), keep_blank_values=True)
                     rec = {'src_ip': ip, 'dst_ip': '', 'method': method, 'url': path, 'params': params, 'user_agent': ua, 'body':'', 'raw': path}
-                    records.append(rec)
                 except Exception as e:
                     import sys
-                    sys.stderr.write(f"Error processing line {line_num}: {e}\n")
+                    sys.stderr.write(f"Error processing record at byte {start}: {e}\n")
                     continue
+                yield rec
         
         import sys
-        sys.stderr.write(f"Parsed {matched_count} records from {line_count} lines in {log_path}\n")
-        return records
+        sys.stderr.write(f"Parsed {matched_count} records from {log_path}\n")
     except Exception as e:
         import sys
         sys.stderr.write(f"Error reading log file {log_path}: {e}\n")
         raise
+
+def parse_access_log(log_path):
+    """Parse Apache/Nginx access log file"""
+    return list(iter_access_log(log_path))
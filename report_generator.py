@@ -4,110 +4,204 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.pdfbase import pdfmetrics
 from datetime import datetime
 from collections import Counter
-import io
+import itertools
+import re
+import tempfile
+
+# Alerts listed individually in the detail table
+DETAIL_ROWS = 50
+
+# 'YYYY-MM-DDTHH:MM' / 'YYYY-MM-DD HH:MM' prefix of string timestamps
+_TIMESTAMP_PREFIX_RE = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}')
+
+# Bytes of PDF output kept in memory before the report buffer moves to a temp file
+PDF_SPOOL_MAX_MEMORY = 1024 * 1024
+
+# The report only uses the built-in Helvetica faces; load their metrics once at import
+# rather than on the first build inside a request
+for _font in ('Helvetica', 'Helvetica-Bold'):
+    pdfmetrics.getFont(_font)
+
+# Brand colours (#9333EA, #EC4899) as ready-made Color objects
+_PURPLE = colors.Color(0x93 / 255, 0x33 / 255, 0xEA / 255)
+_PINK = colors.Color(0xEC / 255, 0x48 / 255, 0x99 / 255)
+
+# Styles are immutable once built, so every report shares one set
+_STYLES = getSampleStyleSheet()
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor=_PURPLE,
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+_HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=16,
+    textColor=_PINK,
+    spaceAfter=12
+)
+
+_SUMMARY_TS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), _PURPLE),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+])
+_ATTACK_TS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), _PINK),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
+])
+_IP_TS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), _PURPLE),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
+])
+_ALERT_TS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), _PINK),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 9),
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
+])
+
+def _format_timestamp(timestamp):
+    """'YYYY-MM-DD HH:MM' for a detail-table row, from a datetime or an ISO-style string"""
+    if not timestamp:
+        return ''
+    if hasattr(timestamp, 'strftime'):
+        return timestamp.strftime('%Y-%m-%d %H:%M')
+    timestamp = str(timestamp)
+    # ISO strings already start with the minute-resolution value; no parsing needed
+    if _TIMESTAMP_PREFIX_RE.match(timestamp):
+        return f"{timestamp[:10]} {timestamp[11:16]}"
+    return timestamp[:16]
+
+def _detail_row(alert):
+    """One detail-table row: ID, timestamp, source IP, attack type, confidence"""
+    get = alert.get
+    return [
+        str(get('id', '')),
+        _format_timestamp(get('timestamp')),
+        get('src_ip', '')[:15],
+        get('attack', '')[:20],
+        f"{get('confidence', 0)}%"
+    ]
 
 def generate_pdf_report(alerts, ip_stats=None, date_range=None):
-    """Generate PDF report from alerts"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    """
+    Generate PDF report from alerts (returns a seekable binary file positioned at the start)
     
-    # Container for the 'Flowable' objects
-    elements = []
+    alerts may be any iterable (e.g. a generator over a cursor): it is consumed once and
+    only the first DETAIL_ROWS alerts are kept.
+    """
+    # The detail table keeps the first DETAIL_ROWS alerts; the rest are only counted
+    alerts = iter(alerts)
+    recent_alerts = list(itertools.islice(alerts, DETAIL_ROWS))
+    
+    # Attack type distribution and confidence counts in one pass over the alerts
+    total = 0
+    attack_types = Counter()
+    high_confidence = 0
+    critical_alerts = 0
+    for a in itertools.chain(recent_alerts, alerts):
+        total += 1
+        get = a.get
+        attack_types[get('attack', 'Unknown')] += 1
+        confidence = get('confidence', 0)
+        if confidence >= 80:
+            high_confidence += 1
+            if confidence >= 90:
+                critical_alerts += 1
+                continue
+        if get('priority') == 'critical':
+            critical_alerts += 1
     
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#9333EA'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
+    # Small reports stay in memory; large ones spill to disk instead of growing the heap
+    buffer = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_MEMORY, mode='w+b')
+    # Compressed page streams, for this document only
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch, pageCompression=1)
     
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#EC4899'),
-        spaceAfter=12
-    )
+    # Container for the 'Flowable' objects
+    elements = []
     
     # Title
-    elements.append(Paragraph("URL Attack Detector - Security Report", title_style))
+    elements.append(Paragraph("URL Attack Detector - Security Report", _TITLE_STYLE))
     elements.append(Spacer(1, 0.2*inch))
     
     # Report metadata
     now = datetime.now()
-    elements.append(Paragraph(f"<b>Generated:</b> {now.strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+    elements.append(Paragraph(f"<b>Generated:</b> {now.strftime('%Y-%m-%d %H:%M:%S')}", _STYLES['Normal']))
     if date_range:
-        elements.append(Paragraph(f"<b>Date Range:</b> {date_range}", styles['Normal']))
-    elements.append(Paragraph(f"<b>Total Alerts:</b> {len(alerts)}", styles['Normal']))
+        elements.append(Paragraph(f"<b>Date Range:</b> {date_range}", _STYLES['Normal']))
+    elements.append(Paragraph(f"<b>Total Alerts:</b> {total}", _STYLES['Normal']))
     elements.append(Spacer(1, 0.3*inch))
     
     # Executive Summary
-    elements.append(Paragraph("Executive Summary", heading_style))
+    elements.append(Paragraph("Executive Summary", _HEADING_STYLE))
     
-    if not alerts:
-        elements.append(Paragraph("No alerts found in the selected time range.", styles['Normal']))
+    if not total:
+        elements.append(Paragraph("No alerts found in the selected time range.", _STYLES['Normal']))
         # Still build the PDF with just the header
-    elif alerts:
-        # Attack type distribution
-        attack_types = Counter([a.get('attack', 'Unknown') for a in alerts])
-        high_confidence = len([a for a in alerts if a.get('confidence', 0) >= 80])
-        critical_alerts = len([a for a in alerts if a.get('priority') == 'critical' or (a.get('confidence', 0) >= 90)])
+    else:
+        attack_ranking = attack_types.most_common()
         
         summary_data = [
             ['Metric', 'Value'],
-            ['Total Alerts', str(len(alerts))],
+            ['Total Alerts', str(total)],
             ['High Confidence Alerts (≥80%)', str(high_confidence)],
             ['Critical Priority Alerts', str(critical_alerts)],
             ['Unique Attack Types', str(len(attack_types))],
-            ['Top Attack Type', attack_types.most_common(1)[0][0] if attack_types else 'N/A']
+            ['Top Attack Type', attack_ranking[0][0] if attack_ranking else 'N/A']
         ]
         
         summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#9333EA')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-        ]))
+        summary_table.setStyle(_SUMMARY_TS)
         elements.append(summary_table)
         elements.append(Spacer(1, 0.3*inch))
         
         # Attack Type Distribution
-        elements.append(Paragraph("Attack Type Distribution", heading_style))
+        elements.append(Paragraph("Attack Type Distribution", _HEADING_STYLE))
         attack_data = [['Attack Type', 'Count', 'Percentage']]
-        total = len(alerts)
-        for attack_type, count in attack_types.most_common():
+        for attack_type, count in attack_ranking:
             percentage = (count / total * 100) if total > 0 else 0
             attack_data.append([attack_type, str(count), f"{percentage:.1f}%"])
         
         attack_table = Table(attack_data, colWidths=[2.5*inch, 1*inch, 1.5*inch])
-        attack_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#EC4899')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
-        ]))
+        attack_table.setStyle(_ATTACK_TS)
         elements.append(attack_table)
         elements.append(PageBreak())
         
         # Top Attacking IPs
         if ip_stats:
-            elements.append(Paragraph("Top Attacking IPs", heading_style))
+            elements.append(Paragraph("Top Attacking IPs", _HEADING_STYLE))
             ip_data = [['IP Address', 'Attack Count', 'Country']]
             for ip_stat in ip_stats[:10]:  # Top 10
                 ip_data.append([
@@ -117,72 +211,18 @@ def generate_pdf_report(alerts, ip_stats=None, date_range=None):
                 ])
             
             ip_table = Table(ip_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
-            ip_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#9333EA')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 11),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
-            ]))
+            ip_table.setStyle(_IP_TS)
             elements.append(ip_table)
             elements.append(Spacer(1, 0.3*inch))
     
-    # Detailed Alerts (limited to most recent 50)
-    elements.append(Paragraph("Recent Alerts (Top 50)", heading_style))
+    # Detailed Alerts (limited to the first DETAIL_ROWS)
+    elements.append(Paragraph(f"Recent Alerts (Top {DETAIL_ROWS})", _HEADING_STYLE))
     alert_data = [['ID', 'Timestamp', 'Source IP', 'Attack Type', 'Confidence']]
-    
-    for alert in alerts[:50]:
-        timestamp = alert.get('timestamp', '')
-        if timestamp:
-            try:
-                # Handle both string and datetime objects
-                if isinstance(timestamp, str):
-                    # Try parsing ISO format
-                    try:
-                        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    except:
-                        # Try parsing other common formats
-                        try:
-                            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-                        except:
-                            dt = datetime.now()
-                    timestamp = dt.strftime('%Y-%m-%d %H:%M')
-                elif hasattr(timestamp, 'strftime'):
-                    # It's already a datetime object
-                    timestamp = timestamp.strftime('%Y-%m-%d %H:%M')
-                else:
-                    timestamp = str(timestamp)[:16]
-            except Exception as e:
-                import sys
-                sys.stderr.write(f"Error formatting timestamp: {e}\n")
-                timestamp = str(timestamp)[:16] if timestamp else ''
-        
-        alert_data.append([
-            str(alert.get('id', '')),
-            timestamp[:16] if timestamp else '',
-            alert.get('src_ip', '')[:15],
-            alert.get('attack', '')[:20],
-            f"{alert.get('confidence', 0)}%"
-        ])
+    alert_data.extend(_detail_row(alert) for alert in recent_alerts)
     
     if len(alert_data) > 1:
         alert_table = Table(alert_data, colWidths=[0.5*inch, 1.2*inch, 1.2*inch, 1.5*inch, 1*inch])
-        alert_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#EC4899')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.beige])
-        ]))
+        alert_table.setStyle(_ALERT_TS)
         elements.append(alert_table)
     
     # Build PDF
@@ -191,6 +231,7 @@ def generate_pdf_report(alerts, ip_stats=None, date_range=None):
         buffer.seek(0)
         return buffer
     except Exception as e:
+        buffer.close()
         import sys
         import traceback
         error_trace = traceback.format_exc()
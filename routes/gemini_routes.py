@@ -2,9 +2,11 @@
 Gemini Threat Intelligence Routes
 Flask Blueprint for Gemini API endpoints
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from bson import ObjectId
 import sys
+import threading
+import time
 
 from services.gemini_service import GeminiThreatIntelligence
 from models_mongodb import GeminiThreatIntelDocument
@@ -12,10 +14,34 @@ from models_mongodb import GeminiThreatIntelDocument
 # Create blueprint
 gemini_bp = Blueprint('gemini', __name__, url_prefix='/api/gemini')
 
+# Alert fields sent to Gemini for analysis
+_ALERT_ANALYSIS_PROJECTION = {
+    'attack_type': 1, 'src_ip': 1, 'dst_ip': 1, 'url': 1, 'http_method': 1,
+    'user_agent': 1, 'confidence': 1, 'timestamp': 1, 'raw': 1
+}
+
+# alerts (src_ip, timestamp) index created at startup as ip_time_compound
+_IP_TIME_INDEX = [("src_ip", 1), ("timestamp", -1)]
+
+# Analyses are written once, so GET /analysis/<id> serves the serialized document
+# from a process-wide cache (analysis_id -> (expiry, dict)); misses are not cached
+ANALYSIS_CACHE_TTL = 300
+ANALYSIS_CACHE_SIZE = 2048
+_analysis_cache = {}
+_analysis_cache_lock = threading.Lock()
+
+
+def _cache_analysis(analysis_id, result):
+    """Remember a serialized analysis; the oldest entry is evicted once the cache is full"""
+    with _analysis_cache_lock:
+        _analysis_cache.pop(analysis_id, None)
+        if len(_analysis_cache) >= ANALYSIS_CACHE_SIZE:
+            _analysis_cache.pop(next(iter(_analysis_cache)), None)
+        _analysis_cache[analysis_id] = (time.monotonic() + ANALYSIS_CACHE_TTL, result)
+
 
 def get_gemini_service():
     """Get Gemini service instance (injected from app)"""
-    from flask import current_app
     return current_app.gemini_service
 
 
@@ -31,13 +57,16 @@ def analyze_threat():
         
         if not alert_id and not ip_address:
             return jsonify({'error': 'Either alert_id or ip_address required'}), 400
+        if alert_id and not ObjectId.is_valid(alert_id):
+            return jsonify({'error': 'Invalid alert_id'}), 400
         
         service = get_gemini_service()
         
         # If alert_id provided, fetch alert first
         if alert_id:
-            from flask import current_app
-            alert = current_app.mongo.db.alerts.find_one({"_id": ObjectId(alert_id)})
+            alert = current_app.mongo.db.alerts.find_one(
+                {"_id": ObjectId(alert_id)}, projection=_ALERT_ANALYSIS_PROJECTION
+            )
             if not alert:
                 return jsonify({'error': 'Alert not found'}), 404
             
@@ -61,11 +90,9 @@ def analyze_threat():
             analysis = service.enrich_ip_reputation(ip_address, threat_data)
         
         # Get analysis document
-        analysis_doc = service.db.gemini_threat_intel.find_one({
-            "$or": [
-                {"alert_id": alert_id} if alert_id else {"ip_address": ip_address}
-            ]
-        })
+        analysis_doc = service.db.gemini_threat_intel.find_one(
+            {"alert_id": alert_id} if alert_id else {"ip_address": ip_address}
+        )
         
         if analysis_doc:
             analysis_id = analysis_doc.get('analysis_id')
@@ -95,6 +122,11 @@ def analyze_threat():
 def get_analysis(analysis_id):
     """Get full Gemini analysis by ID"""
     try:
+        with _analysis_cache_lock:
+            hit = _analysis_cache.get(analysis_id)
+        if hit and hit[0] > time.monotonic():
+            return jsonify(hit[1]), 200
+        
         service = get_gemini_service()
         
         analysis = service.db.gemini_threat_intel.find_one({"analysis_id": analysis_id})
@@ -102,6 +134,7 @@ def get_analysis(analysis_id):
             return jsonify({'error': 'Analysis not found'}), 404
         
         result = GeminiThreatIntelDocument.to_dict(analysis)
+        _cache_analysis(analysis_id, result)
         return jsonify(result), 200
     
     except Exception as e:
@@ -115,15 +148,23 @@ def get_threat_intel(ip_address):
     try:
         service = get_gemini_service()
         
-        # Get context from alerts
-        from flask import current_app
-        alerts = list(current_app.mongo.db.alerts.find({"src_ip": ip_address}).limit(10))
+        # Summarise the IP's alerts server-side; only the aggregate comes back
+        summary = next(current_app.mongo.db.alerts.aggregate([
+            {"$match": {"src_ip": ip_address}},
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "attack_types": {"$addToSet": "$attack_type"},
+                "first_seen": {"$min": "$timestamp"},
+                "last_seen": {"$max": "$timestamp"}
+            }}
+        ], hint=_IP_TIME_INDEX), None)
         
         context = {
-            "alert_count": len(alerts),
-            "attack_types": list(set([a.get('attack_type') for a in alerts if a.get('attack_type')])),
-            "first_seen": str(alerts[0].get('timestamp')) if alerts else None,
-            "last_seen": str(alerts[-1].get('timestamp')) if alerts else None
+            "alert_count": summary['count'] if summary else 0,
+            "attack_types": [t for t in summary['attack_types'] if t] if summary else [],
+            "first_seen": str(summary['first_seen']) if summary else None,
+            "last_seen": str(summary['last_seen']) if summary else None
         }
         
         analysis = service.enrich_ip_reputation(ip_address, context)
@@ -157,29 +198,31 @@ def batch_analyze():
         
         service = get_gemini_service()
         
-        # Fetch alerts
-        from flask import current_app
-        from bson import ObjectId
+        # Fetch all alerts in one round trip, keeping the requested order
+        oids = [ObjectId(a) for a in alert_ids if isinstance(a, str) and ObjectId.is_valid(a)]
+        by_id = {
+            alert['_id']: alert
+            for alert in current_app.mongo.db.alerts.find(
+                {"_id": {"$in": oids}}, projection=_ALERT_ANALYSIS_PROJECTION
+            )
+        }
         
         alerts = []
-        for alert_id in alert_ids:
-            try:
-                alert = current_app.mongo.db.alerts.find_one({"_id": ObjectId(alert_id)})
-                if alert:
-                    alerts.append({
-                        'id': str(alert['_id']),
-                        'attack_type': alert.get('attack_type', ''),
-                        'src_ip': alert.get('src_ip', ''),
-                        'dst_ip': alert.get('dst_ip', ''),
-                        'url': alert.get('url', ''),
-                        'http_method': alert.get('http_method', ''),
-                        'user_agent': alert.get('user_agent', ''),
-                        'confidence': alert.get('confidence', 0),
-                        'timestamp': str(alert.get('timestamp', '')),
-                        'raw': alert.get('raw', '')
-                    })
-            except Exception:
-                continue
+        for oid in dict.fromkeys(oids):
+            alert = by_id.get(oid)
+            if alert:
+                alerts.append({
+                    'id': str(alert['_id']),
+                    'attack_type': alert.get('attack_type', ''),
+                    'src_ip': alert.get('src_ip', ''),
+                    'dst_ip': alert.get('dst_ip', ''),
+                    'url': alert.get('url', ''),
+                    'http_method': alert.get('http_method', ''),
+                    'user_agent': alert.get('user_agent', ''),
+                    'confidence': alert.get('confidence', 0),
+                    'timestamp': str(alert.get('timestamp', '')),
+                    'raw': alert.get('raw', '')
+                })
         
         # Batch analyze
         results = service.batch_analyze_alerts(alerts)
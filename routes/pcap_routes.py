@@ -2,23 +2,38 @@
 PCAP Capture Routes
 Flask Blueprint for PCAP capture endpoints
 """
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, current_app, request, jsonify, send_file
 from bson import ObjectId
 import os
+import queue
 import sys
 import re
+import threading
+from urllib.parse import quote
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:  # Optional: gevent async mode
+    gevent_monkey = None
 
 from services.pcap_service import PcapCaptureService
-from utils.pcap_utils import get_available_interfaces
-from config.pcap_config import PCAP_STORAGE_PATH
+from utils.pcap_utils import get_available_interfaces, sanitize_file_path
+from config.pcap_config import PCAP_STORAGE_PATH, PCAP_ACCEL_REDIRECT_PREFIX
 
 # Create blueprint
 pcap_bp = Blueprint('pcap', __name__, url_prefix='/api/pcap')
 
+# Capture filenames: letters, digits, underscores and hyphens only
+_SAFE_FILENAME_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# Capture files waiting to be unlinked by the background delete thread (threading mode)
+_delete_queue = queue.Queue()
+_delete_thread = None
+_delete_thread_lock = threading.Lock()
+
 
 def get_pcap_service():
     """Get PCAP service instance (injected from app)"""
-    from flask import current_app
     return current_app.pcap_service
 
 
@@ -59,9 +74,8 @@ def start_capture():
         
         # Validate filename if provided
         if filename:
-            from werkzeug.utils import secure_filename
             # Check if filename contains only safe characters
-            if not re.match(r'^[a-zA-Z0-9_-]+$', filename):
+            if not isinstance(filename, str) or not _SAFE_FILENAME_RE.fullmatch(filename):
                 return jsonify({'error': 'Filename can only contain letters, numbers, underscores, and hyphens'}), 400
             if len(filename) > 100:
                 return jsonify({'error': 'Filename too long (max 100 characters)'}), 400
@@ -133,7 +147,6 @@ def download_capture(capture_id):
             return jsonify({'error': 'PCAP file path not found'}), 404
         
         # Sanitize and validate path to prevent directory traversal
-        from utils.pcap_utils import sanitize_file_path
         try:
             # Ensure the file path is within the storage directory
             sanitized_path = sanitize_file_path(file_path, PCAP_STORAGE_PATH)
@@ -150,11 +163,24 @@ def download_capture(capture_id):
             # Fallback to capture_id-based filename
             filename = f"capture_{capture_id[:8]}.pcap"
         
+        # Behind nginx, let it sendfile() the capture straight from disk
+        if PCAP_ACCEL_REDIRECT_PREFIX:
+            rel_path = os.path.relpath(sanitized_path, os.path.realpath(PCAP_STORAGE_PATH))
+            response = Response(mimetype='application/vnd.tcpdump.pcap')
+            response.headers['X-Accel-Redirect'] = (
+                PCAP_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(rel_path.replace(os.sep, '/'))
+            )
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+        
+        # Otherwise the server's wsgi.file_wrapper streams it (sendfile under gunicorn),
+        # with Range/If-Modified-Since support for resumed downloads
         return send_file(
             sanitized_path,
             mimetype='application/vnd.tcpdump.pcap',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            conditional=True
         )
     
     except ValueError as e:
@@ -164,6 +190,48 @@ def download_capture(capture_id):
         return jsonify({'error': 'Internal server error'}), 500
 
 
+def _remove_capture_file(file_path):
+    """Unlink a deleted capture's file (runs off the request path)"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        sys.stderr.write(f"Error deleting file {file_path}: {e}\n")
+
+
+def _file_delete_worker():
+    """Background thread: unlink capture files queued by delete_capture"""
+    while True:
+        _remove_capture_file(_delete_queue.get())
+
+
+def _queue_file_delete(file_path):
+    """
+    Unlink a capture file on a native OS thread
+    
+    Under gevent/eventlet, threading.Thread is a green thread and a blocking unlink would
+    stall the whole worker, so the file goes to the hub's native thread pool instead.
+    Otherwise a background delete thread (started on first use) removes it.
+    """
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('threading'):
+        import gevent
+        gevent.get_hub().threadpool.spawn(_remove_capture_file, file_path)
+        return
+    if 'eventlet' in sys.modules and sys.modules['eventlet'].patcher.is_monkey_patched('thread'):
+        import eventlet
+        from eventlet import tpool
+        eventlet.spawn_n(tpool.execute, _remove_capture_file, file_path)
+        return
+    
+    global _delete_thread
+    with _delete_thread_lock:
+        if _delete_thread is None:
+            _delete_thread = threading.Thread(target=_file_delete_worker, daemon=True)
+            _delete_thread.start()
+    _delete_queue.put(file_path)
+
+
 @pcap_bp.route('/delete/<capture_id>', methods=['DELETE'])
 def delete_capture(capture_id):
     """Delete a capture and its file"""
@@ -180,17 +248,14 @@ def delete_capture(capture_id):
             except Exception:
                 pass  # Continue with deletion even if stop fails
         
-        # Delete file
-        file_path = capture.get('file_path')
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                sys.stderr.write(f"Error deleting file {file_path}: {e}\n")
-        
         # Delete database record
         service.db.pcap_captures.delete_one({"capture_id": capture_id})
         
+        # Large captures can take a while to unlink; remove the file in the background
+        file_path = capture.get('file_path')
+        if file_path:
+            _queue_file_delete(file_path)
+        
         return jsonify({
             'success': True,
             'message': 'Capture deleted successfully'
@@ -3,8 +3,9 @@
 Rakshak.ai - Master Test Runner
 Entry point for running all comprehensive tests
 """
+import os
+import runpy
 import sys
-import subprocess
 from pathlib import Path
 
 if __name__ == '__main__':
@@ -15,11 +16,9 @@ if __name__ == '__main__':
         print(f"❌ Test runner not found at: {test_runner}")
         sys.exit(1)
     
-    # Forward all arguments to the actual test runner
-    result = subprocess.run(
-        [sys.executable, str(test_runner)] + sys.argv[1:],
-        cwd=Path(__file__).parent
-    )
-    
-    sys.exit(result.returncode)
-
+    # Run the actual test runner in this interpreter, as if it were invoked directly:
+    # same argv, working directory and sys.path[0] (its SystemExit code propagates)
+    sys.argv = [str(test_runner)] + sys.argv[1:]
+    sys.path.insert(0, str(test_runner.parent))
+    os.chdir(Path(__file__).parent)
+    runpy.run_path(str(test_runner), run_name='__main__')
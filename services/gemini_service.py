@@ -3,20 +3,64 @@ Gemini Threat Intelligence Service
 Integrates Google Gemini API for threat analysis
 """
 import json
+import random
 import time
 import sys
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
 from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from pymongo.errors import OperationFailure, PyMongoError
+
+try:
+    import orjson
+except ImportError:  # Optional: faster request/response JSON
+    orjson = None
 
 from config.gemini_config import (
     GEMINI_API_KEY, GEMINI_MODEL, MAX_TOKENS, TEMPERATURE,
-    CACHE_TTL, RATE_LIMIT_PER_MINUTE, MAX_RETRIES, RETRY_DELAY
+    CACHE_TTL, ANALYSIS_RETENTION, RATE_LIMIT_PER_MINUTE, MAX_RETRIES, RETRY_DELAY
 )
 from utils.gemini_prompt_builder import (
     build_threat_analysis_prompt, build_ip_reputation_prompt,
     build_mitigation_prompt, build_traffic_pattern_prompt
 )
+from models_mongodb import utcnow
+
+# Analyses kept in process memory in front of the MongoDB cache
+ANALYSIS_MEMO_SIZE = 4096
+
+# Longest Retry-After (seconds) honoured before a retry
+MAX_RETRY_AFTER = 60
+
+# Concurrent Gemini calls across batch_analyze_alerts calls
+BATCH_MAX_WORKERS = max(1, min(16, RATE_LIMIT_PER_MINUTE // 4))
+
+
+def _json_loads(data):
+    """Decode JSON text or bytes (orjson when installed; its errors subclass json.JSONDecodeError)"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj):
+    """Encode a request body to UTF-8 JSON bytes"""
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+
+# Decodes a JSON value from the middle of a string and stops at its end (C scanner)
+_RAW_JSON_DECODER = json.JSONDecoder()
+
+
+def _retry_after(response):
+    """Seconds a 429/503 response asks the client to wait (0 when absent or not in seconds)"""
+    if response is None:
+        return 0
+    try:
+        return min(float(response.headers.get('Retry-After', 0)), MAX_RETRY_AFTER)
+    except ValueError:
+        return 0
 
 
 class GeminiThreatIntelligence:
@@ -34,52 +78,81 @@ class GeminiThreatIntelligence:
         self.threat_intel_collection = mongo_db.gemini_threat_intel
         self.api_key = api_key or GEMINI_API_KEY
         self.base_url = "https://generativelanguage.googleapis.com/v1beta"
-        self.last_request_time = 0
-        self.request_count = 0
-        self.request_window_start = time.time()
+        
+        # Keep-alive session so Gemini calls reuse TLS connections (retries are handled here)
+        self._session = requests.Session()
+        self._session.mount(self.base_url, HTTPAdapter(pool_connections=4, pool_maxsize=BATCH_MAX_WORKERS, max_retries=0))
+        self._session.headers.update({"Content-Type": "application/json"})
+        # Token bucket: up to RATE_LIMIT_PER_MINUTE requests in a burst, refilled evenly over a minute
+        self._rate_capacity = float(RATE_LIMIT_PER_MINUTE)
+        self._refill_rate = RATE_LIMIT_PER_MINUTE / 60.0
+        self._tokens = self._rate_capacity
+        self._last_refill = time.monotonic()
+        self._rate_lock = threading.Lock()
+        
+        # In-process memo in front of the MongoDB cache: cache_key -> (expiry, analysis)
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+        
+        # Analyses in progress (cache_key -> Future), so concurrent misses share one call
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        
+        # One pool shared by all batch requests, so its workers (green threads under
+        # gunicorn's gevent workers) are reused and total Gemini concurrency stays bounded
+        self._batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='gemini-batch')
         
         if not self.api_key:
             sys.stderr.write("⚠ Warning: GEMINI_API_KEY not set. Gemini features will be disabled.\n")
     
+    def create_indexes(self):
+        """Create threat intel indexes (cache-key lookups and retention expiry)"""
+        self.threat_intel_collection.create_index(
+            [("cache_key", 1), ("created_at", -1)], name="cache_key_created"
+        )
+        try:
+            self.threat_intel_collection.create_index(
+                "created_at", expireAfterSeconds=ANALYSIS_RETENTION, name="gemini_created_at_ttl"
+            )
+        except OperationFailure as e:
+            if e.code not in (85, 86):  # IndexOptionsConflict, IndexKeySpecsConflict
+                raise
+            # A plain created_at index (or an older retention) already exists; retune it in place
+            self.db.command('collMod', self.threat_intel_collection.name, index={
+                'keyPattern': {'created_at': 1}, 'expireAfterSeconds': ANALYSIS_RETENTION
+            })
+    
     def _check_rate_limit(self):
-        """Check and enforce rate limiting"""
-        current_time = time.time()
-        
-        # Reset counter if window expired
-        if current_time - self.request_window_start >= 60:
-            self.request_count = 0
-            self.request_window_start = current_time
-        
-        if self.request_count >= RATE_LIMIT_PER_MINUTE:
-            sleep_time = 60 - (current_time - self.request_window_start)
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-                self.request_count = 0
-                self.request_window_start = time.time()
-        
-        self.request_count += 1
+        """Take a token from the rate-limit bucket, sleeping until one is available"""
+        with self._rate_lock:
+            now = time.monotonic()
+            self._tokens = min(self._rate_capacity, self._tokens + (now - self._last_refill) * self._refill_rate)
+            self._last_refill = now
+            # Going negative reserves the next token, so concurrent callers queue in order
+            self._tokens -= 1
+            wait = -self._tokens / self._refill_rate if self._tokens < 0 else 0
+        
+        if wait > 0:
+            time.sleep(wait)
     
-    def _call_gemini_api(self, prompt, retry_count=0):
+    def _call_gemini_api(self, prompt):
         """
         Call Gemini API with retry logic
         
+        Failed requests are retried up to MAX_RETRIES times with full-jitter exponential
+        backoff, waiting at least as long as a Retry-After header asks.
+        
         Args:
             prompt: Prompt text
-            retry_count: Current retry attempt
             
         Returns:
-            dict: API response
+            str: Response text
         """
         if not self.api_key:
             raise RuntimeError("Gemini API key not configured")
         
-        self._check_rate_limit()
-        
-        url = f"{self.base_url}/models/{GEMINI_MODEL}:generateContent"
-        headers = {
-            "Content-Type": "application/json"
-        }
-        data = {
+        url = f"{self.base_url}/models/{GEMINI_MODEL}:generateContent?key={self.api_key}"
+        payload = _json_dumps({
             "contents": [{
                 "parts": [{
                     "text": prompt
@@ -89,47 +162,38 @@ class GeminiThreatIntelligence:
                 "temperature": TEMPERATURE,
                 "maxOutputTokens": MAX_TOKENS
             }
-        }
+        })
         
-        try:
-            response = requests.post(
-                f"{url}?key={self.api_key}",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            # Extract text from response
-            if 'candidates' in result and len(result['candidates']) > 0:
-                content = result['candidates'][0].get('content', {})
-                parts = content.get('parts', [])
-                if parts and 'text' in parts[0]:
-                    return parts[0]['text']
-            
-            raise ValueError("Unexpected API response format")
+        for attempt in range(MAX_RETRIES + 1):
+            self._check_rate_limit()
+            try:
+                response = self._session.post(url, data=payload, timeout=30)
+                response.raise_for_status()
+                break
+            except requests.exceptions.RequestException as e:
+                if attempt >= MAX_RETRIES:
+                    raise RuntimeError(f"Gemini API call failed after {MAX_RETRIES} retries: {str(e)}") from e
+                delay = random.uniform(0, RETRY_DELAY * (1 << attempt))
+                time.sleep(max(delay, _retry_after(e.response)))
+        
+        result = _json_loads(response.content)
+        
+        # Extract text from response
+        if 'candidates' in result and len(result['candidates']) > 0:
+            content = result['candidates'][0].get('content', {})
+            parts = content.get('parts', [])
+            if parts and 'text' in parts[0]:
+                return parts[0]['text']
         
-        except requests.exceptions.RequestException as e:
-            if retry_count < MAX_RETRIES:
-                time.sleep(RETRY_DELAY * (2 ** retry_count))  # Exponential backoff
-                return self._call_gemini_api(prompt, retry_count + 1)
-            raise RuntimeError(f"Gemini API call failed after {MAX_RETRIES} retries: {str(e)}") from e
+        raise ValueError("Unexpected API response format")
     
     def _parse_json_response(self, text_response):
         """Parse JSON from Gemini response"""
         try:
-            # Try to extract JSON from response
-            text = text_response.strip()
-            
-            # Find JSON object
-            start_idx = text.find('{')
-            end_idx = text.rfind('}') + 1
-            
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = text[start_idx:end_idx]
-                return json.loads(json_str)
+            # Decode the first complete JSON object; any prose after it is ignored
+            start_idx = text_response.find('{')
+            if start_idx >= 0:
+                return _RAW_JSON_DECODER.raw_decode(text_response, start_idx)[0]
             
             # If no JSON found, return as text
             return {"raw_response": text_response}
@@ -139,15 +203,73 @@ class GeminiThreatIntelligence:
             return {"raw_response": text_response}
     
     def _get_cached_analysis(self, cache_key):
-        """Get cached analysis if available"""
-        cutoff = datetime.utcnow() - timedelta(seconds=CACHE_TTL)
+        """
+        Get a cached analysis if available
         
-        cached = self.threat_intel_collection.find_one({
-            "cache_key": cache_key,
-            "created_at": {"$gte": cutoff}
-        })
+        Recently seen keys are answered from process memory; otherwise the newest fresh
+        document is read from MongoDB and remembered until it expires.
         
-        return cached
+        Returns:
+            dict: Gemini response, or None on a miss
+        """
+        now = time.monotonic()
+        with self._memo_lock:
+            hit = self._memo.get(cache_key)
+            if hit and hit[0] > now:
+                return hit[1]
+        
+        cutoff = utcnow() - timedelta(seconds=CACHE_TTL)
+        
+        # Newest fresh entry, read off the (cache_key, created_at) index
+        cached = self.threat_intel_collection.find_one(
+            {"cache_key": cache_key, "created_at": {"$gte": cutoff}},
+            projection={"_id": 0, "gemini_response": 1, "created_at": 1},
+            sort=[("created_at", -1)]
+        )
+        if not cached:
+            return None
+        
+        analysis = cached.get('gemini_response', {})
+        remaining = (cached['created_at'] - cutoff).total_seconds()
+        self._remember_analysis(cache_key, analysis, remaining)
+        return analysis
+    
+    def _remember_analysis(self, cache_key, analysis, ttl=CACHE_TTL):
+        """Keep an analysis in the in-process memo for ttl seconds (oldest entry evicted when full)"""
+        with self._memo_lock:
+            self._memo.pop(cache_key, None)
+            if len(self._memo) >= ANALYSIS_MEMO_SIZE:
+                self._memo.pop(next(iter(self._memo)), None)
+            self._memo[cache_key] = (time.monotonic() + ttl, analysis)
+    
+    def _single_flight(self, cache_key, func, *args):
+        """
+        Run func(*args) for cache_key, sharing the result with concurrent callers
+        
+        While one call for a key is in progress, other callers for the same key wait
+        for its result instead of issuing a duplicate Gemini request.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(cache_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[cache_key] = future
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(cache_key, None)
     
     def analyze_threat(self, alert_data):
         """
@@ -159,13 +281,21 @@ class GeminiThreatIntelligence:
         Returns:
             dict: Analysis results
         """
-        import uuid
-        
+        return self._analyze_threat(alert_data)
+    
+    def _analyze_threat(self, alert_data, pending_docs=None):
+        """analyze_threat; with pending_docs, new documents are appended there instead of inserted"""
         # Check cache
         cache_key = f"alert_{alert_data.get('id') or alert_data.get('src_ip')}"
         cached = self._get_cached_analysis(cache_key)
-        if cached:
-            return cached.get('gemini_response', {})
+        if cached is not None:
+            return cached
+        
+        return self._single_flight(cache_key, self._analyze_threat_uncached, alert_data, cache_key, pending_docs)
+    
+    def _analyze_threat_uncached(self, alert_data, cache_key, pending_docs=None):
+        """Run and store a Gemini threat analysis (fallback response on error)"""
+        import uuid
         
         try:
             prompt = build_threat_analysis_prompt(alert_data)
@@ -192,8 +322,12 @@ class GeminiThreatIntelligence:
             )
             analysis_doc['cache_key'] = cache_key
             
-            # Store in database
-            self.threat_intel_collection.insert_one(analysis_doc)
+            # Store in database (batch callers write all their documents at once)
+            if pending_docs is None:
+                self.threat_intel_collection.insert_one(analysis_doc)
+            else:
+                pending_docs.append(analysis_doc)
+            self._remember_analysis(cache_key, analysis)
             
             return analysis
         
@@ -220,9 +354,13 @@ class GeminiThreatIntelligence:
         # Check cache
         cache_key = f"ip_{ip_address}"
         cached = self._get_cached_analysis(cache_key)
-        if cached:
-            return cached.get('gemini_response', {})
+        if cached is not None:
+            return cached
         
+        return self._single_flight(cache_key, self._enrich_ip_reputation_uncached, ip_address, context, cache_key)
+    
+    def _enrich_ip_reputation_uncached(self, ip_address, context, cache_key):
+        """Run and store a Gemini IP reputation analysis (fallback response on error)"""
         try:
             prompt = build_ip_reputation_prompt(ip_address, context)
             response_text = self._call_gemini_api(prompt)
@@ -244,6 +382,7 @@ class GeminiThreatIntelligence:
             analysis_doc['cache_key'] = cache_key
             
             self.threat_intel_collection.insert_one(analysis_doc)
+            self._remember_analysis(cache_key, analysis)
             
             return analysis
         
@@ -294,29 +433,44 @@ class GeminiThreatIntelligence:
             sys.stderr.write(f"Error in Gemini mitigation: {e}\n")
             return {"error": str(e)}
     
+    def _analyze_batch_item(self, alert, pending_docs):
+        """One batch_analyze_alerts result entry"""
+        try:
+            return {
+                "alert_id": alert.get('id'),
+                "analysis": self._analyze_threat(alert, pending_docs)
+            }
+        except Exception as e:
+            return {
+                "alert_id": alert.get('id'),
+                "error": str(e)
+            }
+    
     def batch_analyze_alerts(self, alert_list):
         """
         Analyze multiple alerts in batch
         
+        Gemini calls are I/O-bound, so alerts are analyzed concurrently; the shared
+        rate limiter still spaces the requests. New analysis documents are written
+        with one insert_many at the end.
+        
         Args:
             alert_list: List of alert dictionaries
             
         Returns:
-            list: List of analysis results
+            list: List of analysis results (in input order)
         """
-        results = []
-        for alert in alert_list:
+        if not alert_list:
+            return []
+        
+        pending_docs = []
+        results = list(self._batch_executor.map(lambda alert: self._analyze_batch_item(alert, pending_docs), alert_list))
+        
+        if pending_docs:
             try:
-                analysis = self.analyze_threat(alert)
-                results.append({
-                    "alert_id": alert.get('id'),
-                    "analysis": analysis
-                })
-            except Exception as e:
-                results.append({
-                    "alert_id": alert.get('id'),
-                    "error": str(e)
-                })
+                self.threat_intel_collection.insert_many(pending_docs, ordered=False)
+            except PyMongoError as e:
+                # Unordered: every document that could be written was written
+                sys.stderr.write(f"Error storing Gemini batch analyses: {e}\n")
         
         return results
-
@@ -0,0 +1,156 @@
+"""
+IP List Service
+In-memory snapshot of active blocklist/whitelist entries, kept in sync via MongoDB change streams
+(or a short TTL reload when change streams are unavailable)
+"""
+import logging
+import time
+
+from pymongo.errors import PyMongoError
+
+from ip_services import CidrSet
+
+logger = logging.getLogger(__name__)
+
+
+class IpListSnapshot:
+    """Active entries of one IP list collection (exact IPs plus CIDR ranges)"""
+
+    def __init__(self, collection, ttl=30):
+        """
+        Initialize snapshot
+
+        Args:
+            collection: MongoDB collection with 'ip' and 'is_active' fields
+            ttl: Seconds a snapshot is trusted when no change stream is running
+        """
+        self.collection = collection
+        self.ips = set()
+        self.networks = CidrSet()
+        self.ttl = ttl
+        self.expires = 0
+        self.streaming = False
+
+    def invalidate(self):
+        """Force a reload on the next lookup (after a local write), unless the change stream will deliver it"""
+        if not self.streaming:
+            self.expires = 0
+
+    def _ensure_fresh(self):
+        """Reload when expired, unless a live change stream is keeping the snapshot current"""
+        if self.expires and (self.streaming or time.monotonic() < self.expires):
+            return
+        try:
+            self.reload()
+        except PyMongoError as e:
+            # Keep serving the previous snapshot; retry after another ttl
+            logger.warning("%s reload failed: %s", self.collection.name, e)
+            self.expires = time.monotonic() + self.ttl
+
+    def reload(self):
+        """Replace the snapshot with the collection's current active entries"""
+        ips = set()
+        networks = CidrSet()
+        for doc in self.collection.find({"is_active": True}, {"ip": 1, "_id": 0}):
+            ip = doc.get('ip')
+            if not ip:
+                continue
+            if '/' in ip:
+                networks.add(ip)
+            else:
+                ips.add(ip)
+
+        # Rebinding is atomic, so readers never see a half-built snapshot
+        self.ips = ips
+        self.networks = networks
+        self.expires = time.monotonic() + self.ttl
+
+    def apply_change(self, change):
+        """
+        Apply one change-stream event
+
+        Args:
+            change: Change event (opened with full_document='updateLookup')
+        """
+        doc = change.get('fullDocument')
+        ip = doc.get('ip') if doc else None
+
+        if change.get('operationType') in ('insert', 'update', 'replace') and ip and '/' not in ip:
+            if doc.get('is_active'):
+                self.ips.add(ip)
+            else:
+                self.ips.discard(ip)
+        else:
+            # Deletes carry only the _id, and CIDR edits rebuild the network set
+            self.reload()
+
+    def watch(self, retry_interval):
+        """
+        Keep the snapshot in sync via a change stream (blocking - run as a background task)
+
+        Args:
+            retry_interval: Seconds between attempts to (re)open the change stream
+        """
+        warned = False
+        while True:
+            try:
+                with self.collection.watch(full_document='updateLookup') as stream:
+                    # Pick up anything written before the stream opened
+                    self.reload()
+                    self.streaming = True
+                    for change in stream:
+                        self.apply_change(change)
+            except PyMongoError as e:
+                # Change streams need a replica set; without one lookups reload every ttl seconds
+                if not warned:
+                    logger.warning("%s change stream unavailable (%s), reloading every %ss", self.collection.name, e, self.ttl)
+                    warned = True
+            finally:
+                self.streaming = False
+            time.sleep(retry_interval)
+
+    def __contains__(self, ip):
+        self._ensure_fresh()
+        return ip in self.ips or ip in self.networks
+
+
+class IpListService:
+    """Service answering blocklist/whitelist membership from memory"""
+
+    def __init__(self, mongo_db, ttl=30):
+        """
+        Initialize IP list service
+
+        Args:
+            mongo_db: MongoDB database instance
+            ttl: Seconds a snapshot is trusted when change streams are unavailable
+        """
+        self.blocklist = IpListSnapshot(mongo_db.blocklist, ttl)
+        self.whitelist = IpListSnapshot(mongo_db.whitelist, ttl)
+        self.ttl = ttl
+
+    def refresh(self):
+        """Mark non-streaming snapshots stale after a local write; the next lookup reloads them"""
+        self.blocklist.invalidate()
+        self.whitelist.invalidate()
+
+    def start(self, start_background_task):
+        """
+        Load both snapshots and start their change-stream watchers
+
+        Args:
+            start_background_task: Task launcher matching the server's async mode
+                (e.g. socketio.start_background_task)
+        """
+        self.blocklist.reload()
+        self.whitelist.reload()
+        start_background_task(self.blocklist.watch, self.ttl)
+        start_background_task(self.whitelist.watch, self.ttl)
+
+    def is_blocked(self, ip):
+        """Check if IP is actively blocked (exact entry or CIDR range)"""
+        return bool(ip) and ip in self.blocklist
+
+    def is_whitelisted(self, ip):
+        """Check if IP is actively whitelisted"""
+        return bool(ip) and ip in self.whitelist
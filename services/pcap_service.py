@@ -21,6 +21,7 @@ from utils.pcap_utils import (
     validate_interface, validate_filter, secure_filename_generator,
     calculate_file_size, count_packets_in_pcap, sanitize_file_path
 )
+from models_mongodb import utcnow
 
 
 class PcapCaptureService:
@@ -67,7 +68,7 @@ class PcapCaptureService:
         
         # Check concurrent capture limit
         with self.lock:
-            active_count = len([c for c in self.active_captures.values() if c.get('process') and c['process'].poll() is None])
+            active_count = sum(1 for c in self.active_captures.values() if c.get('process') and c['process'].poll() is None)
             if active_count >= MAX_CONCURRENT_CAPTURES:
                 raise RuntimeError(f"Maximum concurrent captures ({MAX_CONCURRENT_CAPTURES}) reached")
         
@@ -139,7 +140,7 @@ class PcapCaptureService:
             # Store process info
             process_info = {
                 'process': process,
-                'start_time': datetime.utcnow(),
+                'start_time': utcnow(),
                 'file_path': file_path,
                 'interface': interface,
                 'capture_id': capture_id
@@ -151,7 +152,7 @@ class PcapCaptureService:
             # Update document with process ID
             self.captures_collection.update_one(
                 {"capture_id": capture_id},
-                {"$set": {"process_id": process.pid, "updated_at": datetime.utcnow()}}
+                {"$set": {"process_id": process.pid, "updated_at": utcnow()}}
             )
             
             # Start periodic flush monitoring thread to prevent buffer stuck
@@ -214,9 +215,9 @@ class PcapCaptureService:
                 {"capture_id": capture_id},
                 {"$set": {
                     "status": "failed",
-                    "end_time": datetime.utcnow(),
+                    "end_time": utcnow(),
                     "metadata": {"error": str(e)},
-                    "updated_at": datetime.utcnow()
+                    "updated_at": utcnow()
                 }}
             )
             raise RuntimeError(f"Failed to start capture: {str(e)}") from e
@@ -409,10 +410,10 @@ class PcapCaptureService:
                     {"capture_id": capture_id},
                     {"$set": {
                         "status": "stopped",
-                        "end_time": datetime.utcnow(),
+                        "end_time": utcnow(),
                         "file_size": file_size,
                         "packet_count": packet_count,  # Use immediate count or estimation
-                        "updated_at": datetime.utcnow()
+                        "updated_at": utcnow()
                     }}
                 )
                 
@@ -449,7 +450,7 @@ class PcapCaptureService:
                             {"capture_id": capture_id},
                             {"$set": {
                                 "packet_count": final_count,
-                                "updated_at": datetime.utcnow()
+                                "updated_at": utcnow()
                             }}
                         )
                     except Exception as e:
@@ -474,9 +475,9 @@ class PcapCaptureService:
                     {"capture_id": capture_id},
                     {"$set": {
                         "status": "failed",
-                        "end_time": datetime.utcnow(),
+                        "end_time": utcnow(),
                         "metadata": {"error": str(e)},
-                        "updated_at": datetime.utcnow()
+                        "updated_at": utcnow()
                     }}
                 )
                 raise RuntimeError(f"Failed to stop capture: {str(e)}") from e
@@ -512,9 +513,9 @@ class PcapCaptureService:
                                 {"capture_id": capture_id},
                                 {"$set": {
                                     "status": "completed",
-                                    "end_time": datetime.utcnow(),
+                                    "end_time": utcnow(),
                                     "file_size": file_size,
-                                    "updated_at": datetime.utcnow()
+                                    "updated_at": utcnow()
                                 }}
                             )
                             del self.active_captures[capture_id]
@@ -534,7 +535,7 @@ class PcapCaptureService:
                                         {"capture_id": capture_id},
                                         {"$set": {
                                             "packet_count": packet_count,
-                                            "updated_at": datetime.utcnow()
+                                            "updated_at": utcnow()
                                         }}
                                     )
                                 except Exception as e:
@@ -547,7 +548,7 @@ class PcapCaptureService:
             duration = None
             if capture.get('start_time'):
                 start = capture['start_time']
-                end = capture.get('end_time') or datetime.utcnow()
+                end = capture.get('end_time') or utcnow()
                 if isinstance(start, datetime) and isinstance(end, datetime):
                     duration = (end - start).total_seconds()
             
@@ -581,15 +582,15 @@ class PcapCaptureService:
                                     {"capture_id": capture_id},
                                     {"$set": {
                                         "status": "completed",
-                                        "end_time": datetime.utcnow(),
+                                        "end_time": utcnow(),
                                         "file_size": file_size,
-                                        "updated_at": datetime.utcnow()
+                                        "updated_at": utcnow()
                                     }}
                                 )
                                 del self.active_captures[capture_id]
                                 # Update capture in list
                                 capture['status'] = 'completed'
-                                capture['end_time'] = datetime.utcnow()
+                                capture['end_time'] = utcnow()
                                 capture['file_size'] = file_size
                         else:
                             # Capture marked as running but not in active_captures - mark as completed
@@ -597,12 +598,12 @@ class PcapCaptureService:
                                 {"capture_id": capture_id},
                                 {"$set": {
                                     "status": "completed",
-                                    "end_time": datetime.utcnow(),
-                                    "updated_at": datetime.utcnow()
+                                    "end_time": utcnow(),
+                                    "updated_at": utcnow()
                                 }}
                             )
                             capture['status'] = 'completed'
-                            capture['end_time'] = datetime.utcnow()
+                            capture['end_time'] = utcnow()
             
             from models_mongodb import PcapCaptureDocument
             captures_list = [PcapCaptureDocument.to_dict(c) for c in captures]
@@ -623,7 +624,7 @@ class PcapCaptureService:
         Returns:
             dict: Cleanup statistics
         """
-        cutoff_date = datetime.utcnow() - timedelta(days=days_threshold)
+        cutoff_date = utcnow() - timedelta(days=days_threshold)
         
         # Find old captures
         old_captures = list(self.captures_collection.find({
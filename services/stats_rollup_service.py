@@ -0,0 +1,315 @@
+"""
+Stats Rollup Service
+Running dashboard counters maintained on alert writes, so /api/stats reads a few small documents
+instead of aggregating the whole alerts collection
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from models_mongodb import utcnow
+
+logger = logging.getLogger(__name__)
+
+# Confidence at or above which an alert counts as high confidence
+HIGH_CONFIDENCE = 80
+
+# Hourly buckets self-delete after this long (only the last 24 are read)
+HOUR_BUCKET_RETENTION = 48 * 3600  # seconds
+
+TOP_IPS_LIMIT = 10
+
+# A rebuild claim older than this is assumed abandoned (worker died mid-build)
+REBUILD_CLAIM_TIMEOUT = 10 * 60  # seconds
+
+# On-demand rebuilds (/api/stats?refresh=true) run at most this often
+REFRESH_MIN_INTERVAL = 60  # seconds
+
+
+def _hour(ts):
+    """Truncate a timestamp to its hour bucket"""
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class StatsRollupService:
+    """
+    Service maintaining the stats_rollup collection
+
+    One document per counter: {_id, kind, key, count}, where kind is one of
+    'attack', 'status', 'priority', 'high_conf', 'hour' (key is the hour start,
+    also stored as 'hour' for the TTL index) or 'ip' (with the last known 'country').
+    """
+
+    def __init__(self, mongo_db):
+        """
+        Initialize stats rollup service
+
+        Args:
+            mongo_db: MongoDB database instance
+        """
+        self.alerts = mongo_db.alerts
+        self.rollup = mongo_db.stats_rollup
+
+    def create_indexes(self, collection=None):
+        """Create rollup indexes (top-IP ordering and hourly bucket expiry)"""
+        collection = self.rollup if collection is None else collection
+        collection.create_index([("kind", 1), ("count", -1)], name="kind_count")
+        collection.create_index("hour", expireAfterSeconds=HOUR_BUCKET_RETENTION, name="hour_ttl")
+
+    # ------------------------------------------------------------------
+    # Write side
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _alert_deltas(alerts, sign):
+        """Counter of (kind, key) -> increment for a set of alert documents"""
+        deltas = Counter()
+        for alert in alerts:
+            deltas[('attack', alert.get('attack_type'))] += sign
+            deltas[('status', alert.get('status', 'new'))] += sign
+            deltas[('priority', alert.get('priority', 'medium'))] += sign
+            if (alert.get('confidence') or 0) >= HIGH_CONFIDENCE:
+                deltas[('high_conf', None)] += sign
+            if isinstance(alert.get('timestamp'), datetime):
+                deltas[('hour', _hour(alert['timestamp']))] += sign
+            if alert.get('src_ip'):
+                deltas[('ip', alert['src_ip'])] += sign
+        return deltas
+
+    def _apply(self, deltas, countries=None):
+        """Apply counter increments in one unordered bulk write"""
+        ops = []
+        for (kind, key), n in deltas.items():
+            if not n:
+                continue
+            if key is None:
+                counter_id = kind
+            elif isinstance(key, datetime):
+                counter_id = f"{kind}:{key.isoformat()}"
+            else:
+                counter_id = f"{kind}:{key}"
+
+            on_insert = {"kind": kind, "key": key}
+            if kind == 'hour':
+                on_insert['hour'] = key
+            update = {"$inc": {"count": n}, "$setOnInsert": on_insert}
+            if kind == 'ip' and countries and countries.get(key):
+                update["$set"] = {"country": countries[key]}
+            ops.append(UpdateOne({"_id": counter_id}, update, upsert=True))
+
+        if ops:
+            self.rollup.bulk_write(ops, ordered=False)
+
+    def record_inserted(self, alerts):
+        """
+        Count newly inserted alerts
+
+        Args:
+            alerts: Inserted alert documents
+        """
+        countries = {
+            alert['src_ip']: alert['geolocation'].get('country')
+            for alert in alerts
+            if alert.get('src_ip') and alert.get('geolocation')
+        }
+        self._apply(self._alert_deltas(alerts, 1), countries)
+
+    def record_deleted(self, alert):
+        """
+        Uncount a deleted alert
+
+        Args:
+            alert: The alert document as it was before deletion
+        """
+        self._apply(self._alert_deltas([alert], -1))
+
+    def field_counts(self, alert_ids):
+        """
+        Current (status, priority) combinations for alerts about to be updated
+
+        Args:
+            alert_ids: List of alert ObjectIds
+
+        Returns:
+            Counter mapping (status, priority) -> number of alerts
+        """
+        pipeline = [
+            {"$match": {"_id": {"$in": alert_ids}}},
+            {"$group": {"_id": {"status": "$status", "priority": "$priority"}, "n": {"$sum": 1}}}
+        ]
+        return Counter({
+            (doc['_id'].get('status', 'new'), doc['_id'].get('priority', 'medium')): doc['n']
+            for doc in self.alerts.aggregate(pipeline)
+        })
+
+    def record_updates(self, previous, updates):
+        """
+        Move status/priority counts after an update
+
+        Args:
+            previous: Counter of (status, priority) -> alerts before the update
+            updates: Fields set by the update (only 'status' and 'priority' are counted)
+        """
+        deltas = Counter()
+        for (status, priority), n in previous.items():
+            if 'status' in updates and updates['status'] != status:
+                deltas[('status', status)] -= n
+                deltas[('status', updates['status'])] += n
+            if 'priority' in updates and updates['priority'] != priority:
+                deltas[('priority', priority)] -= n
+                deltas[('priority', updates['priority'])] += n
+        self._apply(deltas)
+
+    # ------------------------------------------------------------------
+    # Read side
+    # ------------------------------------------------------------------
+
+    def read(self):
+        """
+        Dashboard counters
+
+        Returns:
+            Dictionary with high_conf, recent (last 24 hourly buckets), attack, status,
+            priority distributions and top_ips ([{_id, count, country}], by count desc)
+        """
+        stats = {'high_conf': 0, 'attack': {}, 'status': {}, 'priority': {}}
+        for doc in self.rollup.find({"kind": {"$in": ["attack", "status", "priority", "high_conf"]}, "count": {"$gt": 0}}):
+            if doc['kind'] == 'high_conf':
+                stats['high_conf'] = doc['count']
+            else:
+                stats[doc['kind']][doc['key']] = doc['count']
+        stats['attack'] = dict(sorted(stats['attack'].items(), key=lambda item: item[1], reverse=True))
+
+        # Hour granularity: the current bucket plus the 23 before it
+        cutoff = _hour(utcnow()) - timedelta(hours=23)
+        stats['recent'] = sum(
+            doc['count'] for doc in self.rollup.find({"kind": "hour", "hour": {"$gte": cutoff}}, {"count": 1})
+        )
+
+        stats['top_ips'] = [
+            {'_id': doc['key'], 'count': doc['count'], 'country': doc.get('country')}
+            for doc in self.rollup.find({"kind": "ip", "count": {"$gt": 0}}).sort("count", -1).limit(TOP_IPS_LIMIT)
+        ]
+        return stats
+
+    def _merge_counts(self, staging, kind, group, match=None, extra=None):
+        """
+        Count alerts by one counter kind and write the counters straight into staging
+
+        The documents never pass through Python, so a large number of distinct keys
+        (e.g. source IPs) is bounded by the collection rather than by one BSON result.
+        """
+        if kind == 'hour':
+            key_str = {"$dateToString": {"format": "%Y-%m-%dT%H:00:00", "date": "$_id"}}
+        else:
+            # Same ids as _apply's f"{kind}:{key}"
+            key_str = {"$ifNull": [{"$toString": "$_id"}, "None"]}
+        project = {
+            "_id": {"$concat": [f"{kind}:", key_str]},
+            "kind": {"$literal": kind},
+            "key": "$_id",
+            "count": 1
+        }
+        if kind == 'hour':
+            project['hour'] = "$_id"
+        for field in (extra or {}):
+            project[field] = 1
+
+        pipeline = [{"$match": match}] if match else []
+        pipeline += [
+            {"$group": {"_id": group, "count": {"$sum": 1}, **(extra or {})}},
+            {"$project": project},
+            {"$merge": {"into": staging.name, "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        self.alerts.aggregate(pipeline, allowDiskUse=True)
+
+    def rebuild(self, min_interval=0):
+        """
+        Recompute every counter from the alerts collection (reconciliation)
+
+        Counters are built in a staging collection and swapped in, so readers never
+        see a missing or half-filled rollup. Alert writes recorded between the
+        aggregations and the swap land in the replaced collection and are lost;
+        the counters drift by those writes until the next rebuild.
+
+        Args:
+            min_interval: Skip the rebuild if the last one finished less than this many seconds ago
+
+        Returns:
+            True if this call rebuilt the rollup, False if it was skipped (recent
+            rebuild, or another worker is rebuilding)
+        """
+        if min_interval:
+            meta = self.rollup.find_one({"_id": "meta"}, {"rebuilt_at": 1})
+            if meta and meta.get('rebuilt_at') and utcnow() - meta['rebuilt_at'] < timedelta(seconds=min_interval):
+                return False
+        if not self._claim_rebuild():
+            return False
+
+        # Unique per rebuild, so concurrent rebuilds never share (or drop) a staging collection
+        staging = self.rollup.database[f"{self.rollup.name}_rebuild_{ObjectId()}"]
+        try:
+            hour_cutoff = _hour(utcnow()) - timedelta(seconds=HOUR_BUCKET_RETENTION)
+            self._merge_counts(staging, 'attack', "$attack_type")
+            self._merge_counts(staging, 'status', {"$ifNull": ["$status", "new"]})
+            self._merge_counts(staging, 'priority', {"$ifNull": ["$priority", "medium"]})
+            self._merge_counts(staging, 'hour', {"$dateFromParts": {
+                "year": {"$year": "$timestamp"},
+                "month": {"$month": "$timestamp"},
+                "day": {"$dayOfMonth": "$timestamp"},
+                "hour": {"$hour": "$timestamp"}
+            }}, match={"timestamp": {"$gte": hour_cutoff}})
+            self._merge_counts(
+                staging, 'ip', "$src_ip",
+                match={"src_ip": {"$nin": [None, ""]}},
+                extra={"country": {"$max": "$geolocation.country"}}
+            )
+
+            high_conf = self.alerts.count_documents({"confidence": {"$gte": HIGH_CONFIDENCE}})
+            staging.insert_many([
+                {"_id": "high_conf", "kind": "high_conf", "key": None, "count": high_conf},
+                {"_id": "meta", "kind": "meta", "rebuilt_at": utcnow()}
+            ], ordered=False)
+            self.create_indexes(staging)
+            # Replaces the collection, claim included
+            staging.rename(self.rollup.name, dropTarget=True)
+        except Exception:
+            staging.drop()
+            self.rollup.delete_one({"_id": "rebuild_claim"})
+            raise
+        return True
+
+    def _claim_rebuild(self):
+        """
+        Claim a rebuild so only one runs at a time across workers
+
+        Returns:
+            True if this process holds the claim
+        """
+        now = utcnow()
+        try:
+            # Matches only a stale claim; otherwise the upsert collides with a live one
+            self.rollup.update_one(
+                {"_id": "rebuild_claim", "claimed_at": {"$lt": now - timedelta(seconds=REBUILD_CLAIM_TIMEOUT)}},
+                {"$set": {"claimed_at": now}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def ensure_initialized(self):
+        """Build the rollup from existing alerts the first time it is used"""
+        try:
+            if self.rollup.find_one({"_id": "meta"}, {"_id": 1}) is not None:
+                return
+            if self.rebuild():
+                logger.info("Stats rollup built from existing alerts")
+            else:
+                logger.info("Stats rollup build already running in another worker")
+        except Exception:
+            logger.exception("Stats rollup initialization failed")
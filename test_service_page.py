@@ -228,7 +228,7 @@ class ServicePageTester:
             response = self.session.get(f"{self.base_url}/api/blocklist", timeout=10)
             if response.status_code == 200:
                 blocklist = response.json()
-                self.log_result("Get Blocklist", True, f"Found {len(blocklist)} entries")
+                self.log_result("Get Blocklist", True, f"Found {blocklist['total']} entries")
             
             # Add to blocklist
             test_ip = "192.168.1.100"
@@ -254,7 +254,7 @@ class ServicePageTester:
             response = self.session.get(f"{self.base_url}/api/whitelist", timeout=10)
             if response.status_code == 200:
                 whitelist = response.json()
-                self.log_result("Get Whitelist", True, f"Found {len(whitelist)} entries")
+                self.log_result("Get Whitelist", True, f"Found {whitelist['total']} entries")
             
             # Add to whitelist
             test_ip = "192.168.1.200"
@@ -2,6 +2,7 @@
 Gemini Prompt Builder
 Builds structured prompts for Gemini API
 """
+import functools
 from datetime import datetime
 
 
@@ -96,9 +97,10 @@ Format your response as JSON:
     return prompt
 
 
+@functools.lru_cache(maxsize=256)
 def build_mitigation_prompt(threat_type, severity):
     """
-    Build prompt for mitigation recommendations
+    Build prompt for mitigation recommendations (memoized - few threat type/severity pairs)
     
     Args:
         threat_type: Type of threat
@@ -0,0 +1,43 @@
+"""
+orjson JSON Provider
+Flask JSON provider that encodes API responses with orjson (in C) instead of the json module
+"""
+import orjson
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+
+def _default(obj):
+    """Types orjson does not encode natively: ObjectId as str, the rest as Flask does"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    return DefaultJSONProvider.default(obj)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Drop-in replacement for Flask's default provider (app.json = ORJSONProvider(app))
+
+    Output matches the default provider: keys sorted, non-string keys stringified and
+    datetimes passed through to Flask's HTTP-date formatting.
+    """
+
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Bytes go straight into the response body, without a str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=self._options()),
+            mimetype=self.mimetype
+        )
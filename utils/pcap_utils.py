@@ -8,7 +8,8 @@ import re
 import platform
 from pathlib import Path
 from werkzeug.utils import secure_filename
-from datetime import datetime
+
+from models_mongodb import utcnow
 
 
 def _is_windows():
@@ -366,7 +367,7 @@ def secure_filename_generator(prefix="capture"):
     Returns:
         str: Secure filename with timestamp
     """
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    timestamp = utcnow().strftime("%Y%m%d_%H%M%S")
     safe_prefix = secure_filename(prefix)
     filename = f"{safe_prefix}_{timestamp}.pcap"
     return filename